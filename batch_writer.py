@@ -0,0 +1,47 @@
+import asyncio
+from typing import List, Optional
+
+from PyDrocsid.database import db, db_thread
+
+
+def write_rows(rows: list):
+    db.session.bulk_save_objects(rows)
+
+
+class BatchWriter:
+    def __init__(self, max_batch_size: int = 100, max_delay: float = 5):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.queue: List[db.Base] = []
+        self.flush_task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.flushes = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.queue)
+
+    async def add(self, row: db.Base):
+        self.queue.append(row)
+        if len(self.queue) >= self.max_batch_size:
+            await self.flush()
+        elif self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.delayed_flush())
+
+    async def delayed_flush(self):
+        await asyncio.sleep(self.max_delay)
+        await self.flush()
+
+    async def flush(self):
+        if not self.queue:
+            return
+
+        rows, self.queue = self.queue, []
+        await db_thread(write_rows, rows)
+        self.written += len(rows)
+        self.flushes += 1
+
+    async def close(self):
+        if self.flush_task is not None and not self.flush_task.done():
+            self.flush_task.cancel()
+        await self.flush()
@@ -0,0 +1,220 @@
+import asyncio
+import random
+import string
+import time
+from argparse import ArgumentParser
+from typing import List, Callable, Awaitable, Dict
+
+from PyDrocsid.database import db_thread
+from PyDrocsid.events import StopEventHandling
+
+from benchmarks.database import use_sqlite
+from benchmarks.fakes import (
+    FakeGuild,
+    FakeBot,
+    FakeTextChannel,
+    FakeVoiceChannel,
+    FakeMessage,
+    FakeMember,
+    FakeVoiceState,
+    FakeRawMessageDeleteEvent,
+    rest_calls,
+)
+from cogs.inactivity import InactivityCog
+from cogs.logging import LoggingCog
+from cogs.mod import ModCog
+from cogs.reactionrole import ReactionRoleCog
+from cogs.voice_channel import VoiceChannelCog
+from log_dispatcher import log_dispatcher
+from message_cache import message_cache
+from models.dynamic_voice import DynamicVoiceGroup, DynamicVoiceChannel
+from models.reactionrole import ReactionRole
+from models.role_voice_link import RoleVoiceLink
+from role_changes import role_changes
+from settings import Settings
+
+
+def random_text(length: int) -> str:
+    return "".join(random.choices(string.ascii_letters + " ", k=length))
+
+
+def percentile(latencies: List[float], q: float) -> float:
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+async def run_scenario(name: str, events: int, step: Callable[[int], Awaitable[None]]) -> Dict[str, float]:
+    rest_calls.clear()
+    latencies = []
+    start = time.perf_counter()
+    for i in range(events):
+        event_start = time.perf_counter()
+        try:
+            await step(i)
+        except StopEventHandling:
+            pass
+        latencies.append(time.perf_counter() - event_start)
+    total = time.perf_counter() - start
+    await role_changes.close()
+    await log_dispatcher.close()
+
+    latencies.sort()
+    result = {
+        "events_per_second": events / total,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rest_per_event": sum(rest_calls.values()) / events,
+    }
+    print(
+        f"{name:<24} {result['events_per_second']:>10.0f} ev/s"
+        f"  p50 {result['p50_ms']:>7.3f} ms  p99 {result['p99_ms']:>7.3f} ms"
+        f"  {result['rest_per_event']:>5.2f} rest/ev"
+    )
+    return result
+
+
+class Environment:
+    def __init__(self, members: int):
+        self.guild = FakeGuild()
+        self.bot = FakeBot(self.guild)
+        self.members: List[FakeMember] = [self.guild.add_member(f"user{i}") for i in range(members)]
+        self.chat = FakeTextChannel(self.guild, "chat")
+        self.edit_log = FakeTextChannel(self.guild, "edit-log")
+        self.delete_log = FakeTextChannel(self.guild, "delete-log")
+        self.messages: List[FakeMessage] = [
+            FakeMessage(self.chat, random.choice(self.members), random_text(random.randint(10, 400)))
+            for _ in range(members)
+        ]
+
+    async def configure(self):
+        await Settings.set(int, "logging_edit", self.edit_log.id)
+        await Settings.set(int, "logging_delete", self.delete_log.id)
+        await Settings.set(int, "mute_role", self.guild.add_role("Muted").id)
+
+
+async def bench_logging(env: Environment, events: int) -> Dict[str, Dict[str, float]]:
+    cog = LoggingCog(env.bot)
+    await cog.update_routes()
+
+    async def edit(i: int):
+        before = env.messages[i % len(env.messages)]
+        after = FakeMessage(env.chat, before.author, before.content + random_text(8), message_id=before.id)
+        await cog.on_message_edit(before, after)
+
+    async def delete(i: int):
+        await cog.on_message_delete(env.messages[i % len(env.messages)])
+
+    async def raw_delete(i: int):
+        if i % len(env.messages) == 0:
+            # deleted messages are no longer in discord.py's cache but still in the bot's message cache
+            for message in env.messages:
+                message_cache.put(message)
+        await cog.on_raw_message_delete(FakeRawMessageDeleteEvent(env.messages[i % len(env.messages)]))
+
+    return {
+        "logging_edit": await run_scenario("LoggingCog.edit", events, edit),
+        "logging_delete": await run_scenario("LoggingCog.delete", events, delete),
+        "logging_raw_delete": await run_scenario("LoggingCog.raw_delete", events, raw_delete),
+    }
+
+
+async def bench_inactivity(env: Environment, events: int) -> Dict[str, Dict[str, float]]:
+    cog = InactivityCog(env.bot)
+
+    async def message(i: int):
+        await cog.on_message(FakeMessage(env.chat, env.members[i % len(env.members)], "hello"))
+
+    result = {"inactivity_message": await run_scenario("InactivityCog.message", events, message)}
+    await cog.on_shutdown()
+    return result
+
+
+async def bench_reactionrole(env: Environment, events: int) -> Dict[str, Dict[str, float]]:
+    cog = ReactionRoleCog(env.bot)
+    role = env.guild.add_role("Reaction Role")
+    message = await env.chat.send("react here")
+    await db_thread(ReactionRole.create, env.chat.id, message.id, "\U0001F44D", role.id, False, True)
+
+    async def reaction(i: int):
+        await cog.on_raw_reaction_add(message, "\U0001F44D", env.members[i % len(env.members)])
+
+    return {"reactionrole_add": await run_scenario("ReactionRoleCog.add", events, reaction)}
+
+
+async def bench_voice(env: Environment, events: int) -> Dict[str, Dict[str, float]]:
+    cog = VoiceChannelCog(env.bot)
+    channels = [FakeVoiceChannel(env.guild, f"Voice {i}", i) for i in range(4)]
+    for channel in channels:
+        await db_thread(RoleVoiceLink.create, env.guild.add_role(f"In {channel.name}").id, channel.id)
+
+    base = FakeVoiceChannel(env.guild, "Public", 10)
+    group: DynamicVoiceGroup = await db_thread(DynamicVoiceGroup.create, "Public", base.id, True)
+    await db_thread(RoleVoiceLink.create, env.guild.add_role("In Public").id, base.id)
+    dyn_voice = FakeVoiceChannel(env.guild, "Public 1", 11)
+    dyn_text = FakeTextChannel(env.guild, "public-1")
+    await db_thread(DynamicVoiceChannel.create, dyn_voice.id, group.id, dyn_text.id, env.guild.me.id)
+    channels.append(dyn_voice)
+
+    anchor = env.guild.add_member("anchor")
+    dyn_voice.members.append(anchor)
+
+    async def hop(i: int):
+        member = env.members[i % len(env.members)]
+        before = member.voice.channel if member.voice is not None else None
+        after = channels[i % len(channels)]
+        if before is after:
+            after = None
+        if before is not None:
+            before.members.remove(member)
+        if after is not None:
+            after.members.append(member)
+        member.voice = FakeVoiceState(after)
+        await cog.on_voice_state_update(member, FakeVoiceState(before), FakeVoiceState(after))
+
+    return {"voice_hop": await run_scenario("VoiceChannelCog.hop", events, hop)}
+
+
+async def bench_mod(env: Environment, events: int) -> Dict[str, Dict[str, float]]:
+    cog = ModCog(env.bot)
+
+    async def join(i: int):
+        await cog.on_member_join(env.members[i % len(env.members)])
+
+    async def leave(i: int):
+        await cog.on_member_remove(env.members[i % len(env.members)])
+
+    result = {
+        "mod_join": await run_scenario("ModCog.join", events, join),
+        "mod_leave": await run_scenario("ModCog.leave", events, leave),
+    }
+    await cog.on_shutdown()
+    return result
+
+
+BENCHMARKS = {
+    "logging": bench_logging,
+    "inactivity": bench_inactivity,
+    "reactionrole": bench_reactionrole,
+    "voice": bench_voice,
+    "mod": bench_mod,
+}
+
+
+async def main(events: int, members: int, selected: List[str], database: str):
+    use_sqlite(database)
+    random.seed(0)
+    env = Environment(members)
+    await env.configure()
+    for name in selected:
+        await BENCHMARKS[name](env, events)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="benchmark cog hot paths against fake discord objects and sqlite")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--database", default="", help="sqlite database file (default: in memory)")
+    parser.add_argument("--only", action="append", choices=[*BENCHMARKS], help="run only the given benchmark")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(
+        main(args.events, args.members, args.only or [*BENCHMARKS], args.database)
+    )
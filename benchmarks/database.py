@@ -0,0 +1,27 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import StaticPool
+
+from PyDrocsid.database import db
+from migrations import migrate
+
+
+def collate_bin(a: str, b: str) -> int:
+    return (a > b) - (a < b)
+
+
+def use_sqlite(path: str = ""):
+    if path:
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(connection, _):
+        connection.create_collation("utf8mb4_bin", collate_bin)
+
+    db.engine = engine
+    db._SessionFactory = sessionmaker(bind=engine, expire_on_commit=False)
+    db._Session = scoped_session(db._SessionFactory)
+    db.create_tables()
+    migrate()
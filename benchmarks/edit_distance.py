@@ -0,0 +1,66 @@
+import random
+import string
+import time
+from argparse import ArgumentParser
+from typing import Callable
+
+from PyDrocsid.util import calculate_edit_distance
+
+from util import bounded_edit_distance
+
+
+def random_text(length: int) -> str:
+    return "".join(random.choices(string.ascii_letters + " " * 10, k=length))
+
+
+def typo(text: str) -> str:
+    i = random.randrange(len(text))
+    return text[:i] + random.choice(string.ascii_letters) + text[i + 1:]
+
+
+def append(text: str) -> str:
+    return text + " " + random_text(12)
+
+
+def rewrite(text: str) -> str:
+    return random_text(len(text))
+
+
+EDITS = {"typo": typo, "append": append, "rewrite": rewrite}
+
+
+def measure(func: Callable[[], int], budget: float) -> float:
+    runs = 0
+    start = time.perf_counter()
+    while not runs or time.perf_counter() - start < budget:
+        func()
+        runs += 1
+    return (time.perf_counter() - start) / runs
+
+
+def main(sizes, limits, budget: float):
+    random.seed(0)
+    print(f"{'size':>6} {'edit':<8} {'limit':>5} {'full ms':>10} {'bounded ms':>11} {'speedup':>8}")
+    for size in sizes:
+        before = random_text(size)
+        for name, edit in EDITS.items():
+            after = edit(before)
+            full = measure(lambda: calculate_edit_distance(before, after), budget)
+            distance = calculate_edit_distance(before, after)
+            for limit in limits:
+                assert bounded_edit_distance(before, after, limit) == min(distance, limit)
+                bounded = measure(lambda: bounded_edit_distance(before, after, limit), budget)
+                print(
+                    f"{size:>6} {name:<8} {limit:>5} {full * 1000:>10.3f} {bounded * 1000:>11.4f}"
+                    f" {full / bounded:>7.0f}x"
+                )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="compare full and threshold-bounded edit distance on message sized inputs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--large", action="store_true", help="also measure 4000 character messages (takes minutes)")
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--budget", type=float, default=0.2, help="seconds spent measuring each case")
+    args = parser.parse_args()
+    main(args.sizes + [4000] * args.large, args.limits, args.budget)
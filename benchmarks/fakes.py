@@ -0,0 +1,365 @@
+import asyncio
+from collections import Counter
+from datetime import datetime
+from itertools import count
+from typing import Optional, List, Dict, Callable
+
+from discord import Embed
+
+from outbound import current_lane, scheduler
+
+rest_calls: Counter = Counter()
+snowflakes = count(700000000000000000)
+
+# time until a member update reaches the cache, like the GUILD_MEMBER_UPDATE gateway event
+GATEWAY_DELAY = 0.05
+# simulated round trip of REST calls, 0 to not route them through the outbound scheduler
+rest_latency = 0.0
+
+
+def snowflake() -> int:
+    return next(snowflakes)
+
+
+def rest(name: str):
+    rest_calls[name] += 1
+
+
+async def request(name: str):
+    """
+    count a REST call and, if a latency is set, hold a slot of the caller's outbound lane for that long
+    """
+
+    rest(name)
+    if not rest_latency:
+        return
+
+    lane = current_lane.get()
+    await scheduler.acquire(lane)
+    try:
+        await asyncio.sleep(rest_latency)
+    finally:
+        await scheduler.release(lane)
+
+
+class FakePermissions:
+    def __init__(self, administrator: bool = False):
+        self.administrator = administrator
+        self.send_messages = True
+        self.add_reactions = True
+        self.kick_members = True
+        self.ban_members = True
+
+
+class FakeRole:
+    def __init__(self, guild: "FakeGuild", name: str, position: int = 1):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.position = position
+        self.managed = False
+
+    @property
+    def mention(self) -> str:
+        return f"<@&{self.id}>"
+
+    @property
+    def members(self) -> List["FakeMember"]:
+        return [member for member in self.guild.members if self in member.roles]
+
+    def is_default(self) -> bool:
+        return self is self.guild.default_role
+
+    def __str__(self):
+        return self.name
+
+    def __lt__(self, other: "FakeRole") -> bool:
+        return self.position < other.position
+
+    def __ge__(self, other: "FakeRole") -> bool:
+        return self.position >= other.position
+
+
+class FakeUser:
+    def __init__(self, name: str, bot: bool = False):
+        self.id = snowflake()
+        self.name = name
+        self.discriminator = "0001"
+        self.bot = bot
+        self.avatar_url = ""
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+    def __str__(self):
+        return f"{self.name}#{self.discriminator}"
+
+    async def send(self, content: Optional[str] = None, *, embed: Optional[Embed] = None, **_) -> "FakeMessage":
+        await request("send")
+        return FakeMessage(None, self, content or "", embed=embed)
+
+
+class FakeVoiceState:
+    def __init__(self, channel: Optional["FakeVoiceChannel"] = None):
+        self.channel = channel
+
+
+class FakeMember(FakeUser):
+    def __init__(self, guild: "FakeGuild", name: str, bot: bool = False):
+        super().__init__(name, bot)
+        self.guild = guild
+        self.nick: Optional[str] = None
+        self.roles: List[FakeRole] = [guild.default_role] if guild.default_role is not None else []
+        self.joined_at = datetime.utcnow()
+        self.guild_permissions = FakePermissions()
+        self.voice: Optional[FakeVoiceState] = None
+
+    @property
+    def top_role(self) -> FakeRole:
+        return max(self.roles, key=lambda role: role.position)
+
+    def member_update(self, update: Callable[[], None]):
+        asyncio.get_running_loop().call_later(GATEWAY_DELAY, update)
+
+    async def add_roles(self, *roles: FakeRole, atomic: bool = True, **_):
+        # atomic (the default) sends one request per role, otherwise the whole role list is replaced
+        for _ in roles if atomic else roles[:1]:
+            await request("add_role" if atomic else "edit_member")
+        self.member_update(lambda: self.roles.extend(role for role in roles if role not in self.roles))
+
+    async def remove_roles(self, *roles: FakeRole, atomic: bool = True, **_):
+        for _ in roles if atomic else roles[:1]:
+            await request("remove_role" if atomic else "edit_member")
+        self.member_update(lambda: setattr(self, "roles", [role for role in self.roles if role not in roles]))
+
+    async def edit(self, *, roles: Optional[List[FakeRole]] = None, **_):
+        await request("edit_member")
+        if roles is not None:
+            roles = [self.guild.default_role, *(role for role in roles if not role.is_default())]
+            self.member_update(lambda: setattr(self, "roles", roles))
+
+    async def move_to(self, channel: Optional["FakeVoiceChannel"], **_):
+        await request("move_to")
+        self.voice = FakeVoiceState(channel) if channel is not None else None
+
+
+class FakeHistory:
+    def __init__(self, messages: List["FakeMessage"]):
+        self.messages = messages
+
+    async def flatten(self) -> List["FakeMessage"]:
+        return self.messages
+
+    def __aiter__(self):
+        return self.iterate()
+
+    async def iterate(self):
+        for message in self.messages:
+            yield message
+
+
+class FakeChannel:
+    def __init__(self, guild: "FakeGuild", name: str, position: int = 0):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.position = position
+        self.category = None
+        guild.channels[self.id] = self
+
+    @property
+    def mention(self) -> str:
+        return f"<#{self.id}>"
+
+    def __str__(self):
+        return self.name
+
+    def permissions_for(self, _) -> FakePermissions:
+        return FakePermissions(True)
+
+    async def set_permissions(self, *_, **__):
+        await request("set_permissions")
+
+    async def edit(self, **_):
+        await request("edit_channel")
+
+    async def delete(self, **_):
+        await request("delete_channel")
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeTextChannel(FakeChannel):
+    def __init__(self, guild: "FakeGuild", name: str, position: int = 0):
+        super().__init__(guild, name, position)
+        self.messages: List[FakeMessage] = []
+        self.keep_messages = 50
+
+    async def send(self, content: Optional[str] = None, *, embed: Optional[Embed] = None, **_) -> "FakeMessage":
+        await request("send")
+        message = FakeMessage(self, self.guild.me, content or "", embed=embed)
+        self.messages.append(message)
+        del self.messages[: -self.keep_messages]
+        return message
+
+    def history(self, limit: Optional[int] = 100, oldest_first: bool = False, **_) -> FakeHistory:
+        rest("history")
+        messages = self.messages if oldest_first else self.messages[::-1]
+        return FakeHistory(messages[:limit] if limit is not None else messages)
+
+    async def fetch_message(self, message_id: int) -> "FakeMessage":
+        await request("fetch_message")
+        for message in self.messages:
+            if message.id == message_id:
+                return message
+        return FakeMessage(self, self.guild.me, "", message_id=message_id)
+
+    async def delete_messages(self, messages: List["FakeMessage"]):
+        await request("delete_messages")
+        ids = {message.id for message in messages}
+        self.messages = [message for message in self.messages if message.id not in ids]
+
+
+class FakeVoiceChannel(FakeChannel):
+    def __init__(self, guild: "FakeGuild", name: str, position: int = 0):
+        super().__init__(guild, name, position)
+        self.members: List[FakeMember] = []
+
+    async def clone(self, *, name: Optional[str] = None, **_) -> "FakeVoiceChannel":
+        await request("clone_channel")
+        return FakeVoiceChannel(self.guild, name or self.name, self.position)
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        channel: Optional[FakeTextChannel],
+        author: FakeUser,
+        content: str,
+        *,
+        embed: Optional[Embed] = None,
+        message_id: Optional[int] = None,
+        created_at: Optional[datetime] = None,
+    ):
+        self.id = message_id or snowflake()
+        self.channel = channel
+        self.guild = channel.guild if channel is not None else None
+        self.author = author
+        self.content = content
+        self.embeds = [embed] if embed is not None else []
+        self.attachments = []
+        self.created_at = created_at or datetime.utcnow()
+
+    @property
+    def jump_url(self) -> str:
+        return f"https://discord.com/channels/{self.guild.id}/{self.channel.id}/{self.id}"
+
+    async def edit(self, *, content: Optional[str] = None, embed: Optional[Embed] = None, **_):
+        await request("edit_message")
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+
+    async def delete(self, **_):
+        await request("delete_message")
+        if self.channel is not None and self in self.channel.messages:
+            self.channel.messages.remove(self)
+
+    async def add_reaction(self, _):
+        await request("add_reaction")
+
+    async def remove_reaction(self, *_):
+        await request("remove_reaction")
+
+
+class FakeRawMessageDeleteEvent:
+    def __init__(self, message: FakeMessage):
+        self.message_id = message.id
+        self.channel_id = message.channel.id
+        self.guild_id = message.guild.id
+        self.cached_message = None
+
+
+class FakeGuild:
+    def __init__(self, name: str = "Benchmark Guild"):
+        self.id = snowflake()
+        self.name = name
+        self.default_role = FakeRole(self, "@everyone", 0)
+        self.roles: Dict[int, FakeRole] = {self.default_role.id: self.default_role}
+        self.channels: Dict[int, FakeChannel] = {}
+        self._members: Dict[int, FakeMember] = {}
+        self.me = self.add_member("Bot", bot=True)
+        self.me.roles.append(self.add_role("Bot", 1000))
+        self.owner_id = self.me.id
+
+    @property
+    def members(self) -> List[FakeMember]:
+        return list(self._members.values())
+
+    @property
+    def member_count(self) -> int:
+        return len(self._members)
+
+    @property
+    def text_channels(self) -> List[FakeTextChannel]:
+        return [channel for channel in self.channels.values() if isinstance(channel, FakeTextChannel)]
+
+    @property
+    def voice_channels(self) -> List[FakeVoiceChannel]:
+        return [channel for channel in self.channels.values() if isinstance(channel, FakeVoiceChannel)]
+
+    def add_role(self, name: str, position: int = 1) -> FakeRole:
+        role = FakeRole(self, name, position)
+        self.roles[role.id] = role
+        return role
+
+    def add_member(self, name: str, bot: bool = False) -> FakeMember:
+        member = FakeMember(self, name, bot)
+        self._members[member.id] = member
+        return member
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self._members.get(member_id)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self.roles.get(role_id)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id)
+
+    async def create_text_channel(self, name: str, **_) -> FakeTextChannel:
+        await request("create_channel")
+        return FakeTextChannel(self, name)
+
+    async def ban(self, *_, **__):
+        await request("ban")
+
+    async def unban(self, *_, **__):
+        await request("unban")
+
+
+class FakeBot:
+    def __init__(self, guild: FakeGuild):
+        self.guilds = [guild]
+        self.user = guild.me
+        self.latency = 0.05
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        for guild in self.guilds:
+            if (channel := guild.get_channel(channel_id)) is not None:
+                return channel
+        return None
+
+    def get_user(self, user_id: int) -> Optional[FakeMember]:
+        for guild in self.guilds:
+            if (member := guild.get_member(user_id)) is not None:
+                return member
+        return None
+
+    async def fetch_user(self, user_id: int) -> Optional[FakeMember]:
+        await request("fetch_user")
+        return self.get_user(user_id)
+
+    async def change_presence(self, **_):
+        await request("change_presence")
@@ -0,0 +1,166 @@
+import asyncio
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from discord.http import HTTPClient, Route
+
+from benchmarks.database import use_sqlite
+from benchmarks.fakes import snowflake
+from recorder import read_events
+
+
+class ReplayRest:
+    def __init__(self):
+        self.user: dict = {}
+        self.users: Dict[int, dict] = {}
+        self.messages: Dict[int, dict] = {}
+        self.calls: Counter = Counter()
+
+    def observe(self, event: str, data: dict):
+        if event == "READY":
+            self.user = data["user"]
+        elif event == "GUILD_CREATE":
+            for member in data.get("members", []):
+                self.users[int(member["user"]["id"])] = member["user"]
+        elif event == "GUILD_MEMBER_ADD":
+            self.users[int(data["user"]["id"])] = data["user"]
+        elif event == "MESSAGE_CREATE":
+            self.messages[int(data["id"])] = data
+            self.users[int(data["author"]["id"])] = data["author"]
+
+    def message(self, channel_id: int, message_id: Optional[int] = None, content: str = "", embed=None) -> dict:
+        return {
+            "id": str(message_id or snowflake()),
+            "channel_id": str(channel_id),
+            "author": self.user,
+            "content": content or "",
+            "embeds": [embed] if embed else [],
+            "attachments": [],
+            "mentions": [],
+            "mention_roles": [],
+            "mention_everyone": False,
+            "pinned": False,
+            "tts": False,
+            "type": 0,
+            "timestamp": datetime.utcnow().isoformat(),
+            "edited_timestamp": None,
+        }
+
+    async def request(self, route: Route, *, files=None, **kwargs):
+        self.calls[f"{route.method} {route.path}"] += 1
+        payload = kwargs.get("json") or {}
+        target = route.url.rsplit("/", 1)[-1]
+
+        if route.path == "/channels/{channel_id}/messages":
+            if route.method == "POST":
+                return self.message(route.channel_id, None, payload.get("content"), payload.get("embed"))
+            return []
+        if route.path == "/channels/{channel_id}/messages/{message_id}":
+            if route.method == "GET":
+                return self.messages.get(int(target)) or self.message(route.channel_id, int(target))
+            if route.method == "PATCH":
+                return self.message(route.channel_id, int(target), payload.get("content"), payload.get("embed"))
+        if route.path == "/users/@me/channels":
+            return {"id": str(snowflake()), "type": 1, "recipients": [self.users[int(payload["recipient_id"])]]}
+        if route.path == "/guilds/{guild_id}/channels" and route.method == "POST":
+            return {
+                "id": str(snowflake()),
+                "guild_id": str(route.guild_id),
+                "position": 0,
+                "permission_overwrites": [],
+                **payload,
+            }
+        if route.path == "/users/{user_id}":
+            return self.users.get(int(target)) or {"id": target, "username": target, "discriminator": "0000"}
+        return {}
+
+
+async def main(path: str, database: str, top: int):
+    use_sqlite(database)
+
+    rest = ReplayRest()
+    HTTPClient.request = rest.request
+
+    from bot import bot
+    from metrics import handlers
+
+    state = bot._connection
+    state.is_bot = True
+    state._chunk_guilds = False
+    state.guild_ready_timeout = 0.05
+
+    pending: List[asyncio.Task] = []
+    schedule_event = bot._schedule_event
+
+    def capture_event(*args, **kwargs):
+        task = schedule_event(*args, **kwargs)
+        pending.append(task)
+        return task
+
+    bot._schedule_event = capture_event
+
+    async def change_presence(**_):
+        rest.calls["gateway presence"] += 1
+
+    bot.change_presence = change_presence
+
+    errors: Counter = Counter()
+
+    async def drain():
+        while pending:
+            tasks = pending[:]
+            pending.clear()
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(result, Exception):
+                    errors[repr(result)] += 1
+
+    events: Counter = Counter()
+    durations: Counter = Counter()
+    start = time.perf_counter()
+    for _, event, data in read_events(path):
+        if event not in ("READY", "GUILD_CREATE") and state._ready_task is not None:
+            await state._ready_task
+            await drain()
+
+        event_start = time.perf_counter()
+        rest.observe(event, data)
+        state.parsers[event](data)
+        await drain()
+        events[event] += 1
+        durations[event] += time.perf_counter() - event_start
+
+    if state._ready_task is not None:
+        await state._ready_task
+        await drain()
+    total = time.perf_counter() - start
+
+    print(f"replayed {sum(events.values())} events in {total:.3f} s ({sum(events.values()) / total:.0f} ev/s)")
+    print(f"{sum(rest.calls.values())} stubbed rest calls, {sum(errors.values())} handler errors")
+    for error, count in errors.most_common():
+        print(f"  {count:>7}x {error}")
+    for event, count in events.most_common():
+        print(f"  {event:<24} {count:>7}  {durations[event] / count * 1000:>8.3f} ms/ev")
+
+    print("slowest handlers:")
+    for name, metrics in sorted(handlers.items(), key=lambda h: -h[1].latency.sum)[:top]:
+        if not (count := metrics.latency.count):
+            continue
+        print(
+            f"  {name:<48} {count:>7}  p50 {metrics.latency.quantile(0.5) * 1000:>7.2f} ms"
+            f"  p99 {metrics.latency.quantile(0.99) * 1000:>7.2f} ms"
+            f"  {metrics.db_calls / count:>5.2f} db/ev  {metrics.rest_calls / count:>5.2f} rest/ev"
+        )
+
+    await bot.close()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="replay a recorded gateway event log against sqlite with stubbed rest calls")
+    parser.add_argument("path", help="event log written with RECORD_EVENTS")
+    parser.add_argument("--database", default="", help="sqlite database file (default: in memory)")
+    parser.add_argument("--top", type=int, default=15, help="number of handlers to report")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main(args.path, args.database, args.top))
@@ -0,0 +1,175 @@
+import asyncio
+import random
+import time
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from typing import List
+
+from PyDrocsid.database import db, db_thread
+from discord.ext import tasks
+
+from batch_writer import write_rows
+from benchmarks import fakes
+from benchmarks.database import use_sqlite
+from benchmarks.fakes import FakeGuild, FakeBot, FakeVoiceChannel, FakeTextChannel, FakeVoiceState, rest_calls
+from cogs.inactivity import InactivityCog
+from cogs.info import InfoCog
+from cogs.logging import LoggingCog
+from cogs.mod import ModCog
+from cogs.voice_channel import VoiceChannelCog
+from expiry_scheduler import ExpiryScheduler
+from metrics import CountingSemaphore, instrument, get_handler
+from models.dynamic_voice import DynamicVoiceGroup, DynamicVoiceChannel
+from models.mod import Mute, expiry_date
+from models.role_voice_link import RoleVoiceLink
+from outbound import scheduler, in_lane, Lane
+from settings import Settings
+from startup_plan import StartupPlan
+
+STARTUP_COGS = [InactivityCog, LoggingCog, InfoCog, ModCog, VoiceChannelCog]
+
+
+class LargeGuild:
+    def __init__(self, members: int, roles: int):
+        self.guild = FakeGuild("Large Guild")
+        self.bot = FakeBot(self.guild)
+        for i in range(roles):
+            self.guild.add_role(f"Role {i}", i + 1)
+        self.members = [self.guild.add_member(f"user{i}") for i in range(members)]
+        self.voice_channels: List[FakeVoiceChannel] = []
+
+    def join_voice(self, channel: FakeVoiceChannel, count: int):
+        for member in random.sample(self.members, count):
+            if member.voice is None:
+                member.voice = FakeVoiceState(channel)
+                channel.members.append(member)
+
+    async def add_voice_links(self, links: int, in_voice: float):
+        for i in range(links):
+            channel = FakeVoiceChannel(self.guild, f"Voice {i}", len(self.voice_channels))
+            self.voice_channels.append(channel)
+            role = self.guild.add_role(f"In Voice {i}")
+            await db_thread(RoleVoiceLink.create, role.id, channel.id)
+            self.join_voice(channel, int(len(self.members) * in_voice / links))
+
+            # members that left the channel while the bot was offline still hold the role
+            for member in random.sample(self.members, min(len(self.members), 20)):
+                if member.voice is None:
+                    member.roles.append(role)
+
+    async def add_voice_groups(self, groups: int, channels: int, in_voice: float):
+        for i in range(groups):
+            base = FakeVoiceChannel(self.guild, f"Group {i}", 100 + i * (channels + 1))
+            group: DynamicVoiceGroup = await db_thread(DynamicVoiceGroup.create, f"Group {i}", base.id, bool(i % 2))
+            await db_thread(RoleVoiceLink.create, self.guild.add_role(f"In Group {i}").id, base.id)
+            for j in range(channels):
+                voice = FakeVoiceChannel(self.guild, f"Group {i} {j + 1}", base.position + j + 1)
+                text = FakeTextChannel(self.guild, f"group-{i}-{j + 1}")
+                await db_thread(DynamicVoiceChannel.create, voice.id, group.id, text.id, self.guild.me.id)
+                # every other dynamic channel was left empty while the bot was offline
+                if j % 2 == 0:
+                    self.join_voice(voice, max(1, int(len(self.members) * in_voice / (groups * channels))))
+
+    async def add_mutes(self, mutes: int):
+        mute_role = self.guild.add_role("Muted")
+        await Settings.set(int, "mute_role", mute_role.id)
+        now = datetime.utcnow()
+        rows = []
+        for member in random.sample(self.members, min(mutes, len(self.members))):
+            timestamp = now - timedelta(days=random.randint(0, 10))
+            days = random.choice([-1, 7, 30])
+            rows.append(
+                Mute(
+                    member=member.id,
+                    member_name=str(member),
+                    mod=self.guild.me.id,
+                    timestamp=timestamp,
+                    days=days,
+                    reason="benchmark",
+                    active=True,
+                    expires_at=expiry_date(timestamp, days),
+                )
+            )
+        await db_thread(write_rows, rows)
+
+
+async def stop_loops(cog):
+    for attr in vars(cog).values():
+        if isinstance(attr, ExpiryScheduler):
+            await attr.stop()
+    for name, attr in vars(type(cog)).items():
+        if isinstance(attr, tasks.Loop) and (loop := getattr(cog, name)).is_running():
+            # let the first iteration finish so it does not overlap with the next cog's startup
+            loop.stop()
+            while loop.is_running() and not loop.current_loop:
+                await asyncio.sleep(0.01)
+            loop.cancel()
+            await asyncio.gather(loop.get_task(), return_exceptions=True)
+
+
+async def time_startup(env: LargeGuild, concurrency: int, rest_latency: float):
+    db.thread_semaphore = CountingSemaphore(db.thread_semaphore._value)
+    print(f"{'handler':<48} {'seconds':>9} {'db calls':>9} {'rest calls':>11}")
+    plan = StartupPlan()
+    total = 0.0
+    for cog_class in STARTUP_COGS:
+        cog = cog_class(env.bot)
+        for event, args in [("ready", ()), ("startup_plan", (plan,))]:
+            if (handler := getattr(cog, f"on_{event}", None)) is None:
+                continue
+
+            rest_calls.clear()
+            metrics = get_handler(f"{event}:{cog_class.__name__}.on_{event}")
+            start = time.perf_counter()
+            await instrument(metrics.name, handler)(*args)
+            duration = time.perf_counter() - start
+            total += duration
+            await stop_loops(cog)
+            rest = ", ".join(f"{name} {count}" for name, count in rest_calls.most_common())
+            print(f"{metrics.name:<48} {duration:>9.3f} {metrics.db_calls:>9} {sum(rest_calls.values()):>11}  {rest}")
+    print(f"{'total':<48} {total:>9.3f}")
+
+    # the plan runs in the startup lane like in bot.py, with REST calls held for the simulated latency
+    rest_calls.clear()
+    fakes.rest_latency = rest_latency
+    scheduler.slots[Lane.STARTUP] = concurrency
+    start = time.perf_counter()
+    await in_lane(Lane.STARTUP)(plan.execute)(concurrency)
+    fakes.rest_latency = 0
+    print(
+        f"startup plan: {plan.total} actions executed in {time.perf_counter() - start:.3f} s,"
+        f" {sum(rest_calls.values())} rest calls,"
+        f" p99 lane wait {scheduler.wait_time[Lane.STARTUP].quantile(0.99) * 1000:.1f} ms"
+    )
+
+
+async def main(args):
+    use_sqlite(args.database)
+    random.seed(0)
+
+    start = time.perf_counter()
+    env = LargeGuild(args.members, args.roles)
+    await env.add_voice_links(args.links, args.in_voice)
+    await env.add_voice_groups(args.groups, args.dynamic_channels, args.in_voice)
+    await env.add_mutes(args.mutes)
+    print(
+        f"generated guild with {args.members} members, {len(env.guild.roles)} roles,"
+        f" {len(env.guild.channels)} channels in {time.perf_counter() - start:.1f} s"
+    )
+
+    await time_startup(env, args.concurrency, args.rest_latency)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="time each cog's startup against a generated large guild")
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--roles", type=int, default=50, help="roles without voice links")
+    parser.add_argument("--links", type=int, default=20, help="voice channels with a linked role")
+    parser.add_argument("--groups", type=int, default=5, help="dynamic voice groups")
+    parser.add_argument("--dynamic-channels", type=int, default=4, help="dynamic voice channels per group")
+    parser.add_argument("--mutes", type=int, default=500, help="active mutes")
+    parser.add_argument("--in-voice", type=float, default=0.02, help="fraction of members in a voice channel")
+    parser.add_argument("--concurrency", type=int, default=4, help="startup plan concurrency budget")
+    parser.add_argument("--rest-latency", type=float, default=0.01, help="simulated REST round trip in seconds")
+    parser.add_argument("--database", default="", help="sqlite database file (default: in memory)")
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -1,16 +1,18 @@
 import os
 import string
 import time
-from typing import Iterable, Optional
+from asyncio import Lock, sleep
+from datetime import timedelta
+from typing import Iterable, Optional, List
 
 import sentry_sdk
 from PyDrocsid.command_edit import add_to_error_cache
 from PyDrocsid.database import db
-from PyDrocsid.events import listener, register_cogs
+from PyDrocsid.events import listener, register_cogs, call_event_handlers
 from PyDrocsid.help import send_help
 from PyDrocsid.translations import translations
 from PyDrocsid.util import measure_latency, send_long_embed
-from discord import Message, User, Forbidden, AllowedMentions, Embed, TextChannel, Intents
+from discord import Message, User, Forbidden, AllowedMentions, Embed, TextChannel, Intents, DMChannel, HTTPException
 from discord.ext import tasks
 from discord.ext.commands import Bot, Context, guild_only, CommandError, CommandNotFound, UserInputError
 from sentry_sdk.integrations.aiohttp import AioHttpIntegration
@@ -28,7 +30,15 @@ from cogs.roles import RolesCog
 from cogs.rules import RulesCog
 from cogs.voice_channel import VoiceChannelCog
 from info import VERSION, GITHUB_LINK, CONTRIBUTORS
-from permissions import Permission, PermissionLevel
+from log_archive import log_archive
+from message_cache import message_cache
+from metrics import instrument_bot, start_server, register_gauge, handlers
+from migrations import migrate
+from outbound import schedule_requests, scheduler, in_lane, Lane
+from permissions import Permission, PermissionLevel, load_permission_table
+from recorder import start_recording
+from settings import Settings
+from startup_plan import StartupPlan
 from util import get_prefix, set_prefix, make_error, send_to_changelog
 
 sentry_dsn = os.environ.get("SENTRY_DSN")
@@ -42,6 +52,7 @@ if sentry_dsn:
     )
 
 db.create_tables()
+migrate()
 
 
 async def fetch_prefix(_, message: Message) -> Iterable[str]:
@@ -50,12 +61,22 @@ async def fetch_prefix(_, message: Message) -> Iterable[str]:
     return await get_prefix(), f"<@!{bot.user.id}> ", f"<@{bot.user.id}> "
 
 
+class CrypticBot(Bot):
+    async def close(self):
+        await call_event_handlers("shutdown")
+        await super().close()
+
+
 intents = Intents.all()
 
-bot = Bot(command_prefix=fetch_prefix, case_insensitive=True, intents=intents)
+bot = CrypticBot(command_prefix=fetch_prefix, case_insensitive=True, intents=intents)
 bot.remove_command("help")
 
 
+register_gauge("settings_cache_hits", lambda: Settings.hits)
+register_gauge("settings_cache_misses", lambda: Settings.misses)
+
+
 def get_owner() -> Optional[User]:
     owner_id = os.getenv("OWNER_ID")
     if owner_id and owner_id.isnumeric():
@@ -65,6 +86,9 @@ def get_owner() -> Optional[User]:
 
 @listener
 async def on_ready():
+    await Settings.load()
+    await load_permission_table()
+
     if (owner := get_owner()) is not None:
         try:
             await owner.send("logged in")
@@ -73,6 +97,8 @@ async def on_ready():
 
     print(f"Logged in as {bot.user}")
 
+    bot.loop.create_task(run_startup_plan())
+
     if owner is not None:
         try:
             status_loop.start()
@@ -80,19 +106,73 @@ async def on_ready():
             status_loop.restart()
 
 
+startup_lock = Lock()
+
+
+@in_lane(Lane.STARTUP)
+async def run_startup_plan():
+    if startup_lock.locked():
+        return
+
+    async with startup_lock:
+        plan = StartupPlan()
+        await call_event_handlers("startup_plan", plan)
+
+        owner: Optional[User] = get_owner()
+        status: Optional[Message] = None
+
+        async def report(content: str):
+            nonlocal status
+            if owner is None:
+                return
+            try:
+                if status is None:
+                    status = await owner.send(content)
+                else:
+                    await status.edit(content=content)
+            except Forbidden:
+                pass
+
+        concurrency = scheduler.slots[Lane.STARTUP] = await Settings.get(int, "startup_concurrency", 4)
+        start = time.perf_counter()
+        await plan.execute(concurrency, lambda p: report(translations.f_startup_progress(p.completed, p.total)))
+        summary = translations.f_startup_done(plan.total, time.perf_counter() - start, sum(plan.failed.values()))
+        print(summary)
+        await report(summary)
+
+
+async def measure_loop_lag() -> float:
+    start = bot.loop.time()
+    await sleep(0)
+    return bot.loop.time() - start
+
+
 @tasks.loop(seconds=20)
+# the heartbeat is a liveness signal, so it must not queue behind startup or background work
+@in_lane(Lane.INTERACTIVE)
 async def status_loop():
     if (owner := get_owner()) is None:
         return
-    messages = await owner.history(limit=1).flatten()
-    content = "heartbeat: " + time.ctime()
-    if messages and messages[0].content.startswith("heartbeat: "):
-        await messages[0].edit(content=content)
+    content = translations.f_heartbeat(time.ctime(), bot.latency * 1000, await measure_loop_lag() * 1000)
+    channel: DMChannel = owner.dm_channel or await owner.create_dm()
+
+    if (message_id := await Settings.get(int, "heartbeat_message")) is not None:
+        try:
+            await bot.http.edit_message(channel.id, message_id, content=content)
+            return
+        except HTTPException:
+            pass
+
+    messages: List[Message] = await channel.history(limit=1).flatten()
+    if messages and messages[0].author == bot.user and messages[0].content.startswith("heartbeat: "):
+        message = messages[0]
+        await message.edit(content=content)
     else:
         try:
-            await owner.send(content)
+            message = await channel.send(content)
         except Forbidden:
-            pass
+            return
+    await Settings.set(int, "heartbeat_message", message.id)
 
 
 @bot.command()
@@ -108,6 +188,33 @@ async def ping(ctx: Context):
         await ctx.send(translations.pong)
 
 
+@bot.command(name="metrics")
+@Permission.view_metrics.check
+async def show_metrics(ctx: Context):
+    """
+    show latency and call statistics of event handlers and commands
+    """
+
+    embed = Embed(title=translations.metrics, color=0x256BE6)
+    out = []
+    for name, metrics in sorted(handlers.items(), key=lambda h: -h[1].latency.sum):
+        if not (count := metrics.latency.count):
+            continue
+        out.append(
+            translations.f_metrics_line(
+                name,
+                count,
+                metrics.latency.quantile(0.5) * 1000,
+                metrics.latency.quantile(0.99) * 1000,
+                metrics.db_calls / count,
+                metrics.rest_calls / count,
+                metrics.errors,
+            )
+        )
+    embed.description = "\n".join(out) or translations.no_metrics
+    await send_long_embed(ctx, embed)
+
+
 @bot.command(name="prefix")
 @Permission.change_prefix.check
 @guild_only()
@@ -284,4 +391,20 @@ register_cogs(
     InfoCog,
     RoleNotificationsCog,
 )
-bot.run(os.environ["TOKEN"])
+instrument_bot(bot)
+schedule_requests(bot)
+
+if __name__ == "__main__":
+    if record_path := os.getenv("RECORD_EVENTS"):
+        start_recording(bot, record_path)
+    if cache_size := os.getenv("MESSAGE_CACHE_SIZE"):
+        message_cache.max_size = int(cache_size) << 20
+    if cache_path := os.getenv("MESSAGE_CACHE_PATH"):
+        message_cache.spill_to(cache_path)
+    if archive_max_age := os.getenv("LOG_ARCHIVE_MAX_AGE"):
+        log_archive.max_age = timedelta(days=int(archive_max_age))
+    if archive_path := os.getenv("LOG_ARCHIVE_PATH"):
+        log_archive.open(archive_path)
+    if metrics_port := os.getenv("METRICS_PORT"):
+        bot.loop.create_task(start_server(os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port)))
+    bot.run(os.environ["TOKEN"])
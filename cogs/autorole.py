@@ -8,6 +8,7 @@ from discord.ext.commands import Cog, Bot, guild_only, Context, UserInputError,
 
 from models.autorole import AutoRole
 from permissions import Permission
+from role_changes import role_changes
 from util import send_to_changelog
 
 
@@ -16,7 +17,9 @@ class AutoRoleCog(Cog, name="AutoRole"):
         self.bot = bot
 
     async def on_member_join(self, member: Member):
-        await member.add_roles(*filter(lambda r: r, map(member.guild.get_role, await db_thread(AutoRole.all))))
+        await role_changes.add_roles(
+            member, *filter(lambda r: r, map(member.guild.get_role, await db_thread(AutoRole.all)))
+        )
 
     @commands.group(aliases=["ar"])
     @Permission.manage_ar.check
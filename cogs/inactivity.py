@@ -1,17 +1,18 @@
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 from PyDrocsid.database import db_thread, db
-from PyDrocsid.settings import Settings
 from PyDrocsid.translations import translations
 from PyDrocsid.util import send_long_embed
 from discord import Message, Guild, Member, Embed, Role
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ext.commands import Cog, Bot, guild_only, Context, CommandError
 
 from cogs.logging import ignore
 from models.activity import Activity
+from outbound import in_lane, Lane
 from permissions import Permission
+from settings import Settings
 from util import ACTIVE_ROLES, send_to_changelog, code
 
 
@@ -42,16 +43,49 @@ async def last_activity(member: Member) -> Optional[datetime]:
 class InactivityCog(Cog, name="Inactivity"):
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.stored_activity: Dict[int, datetime] = {}
+        self.pending_activity: Dict[int, datetime] = {}
+
+    async def on_ready(self):
+        self.stored_activity = {a.user_id: a.last_message for a in await db_thread(db.all, Activity)}
+
+        try:
+            self.activity_loop.start()
+        except RuntimeError:
+            self.activity_loop.restart()
+
+    async def on_shutdown(self):
+        await self.flush_activity()
+
+    @tasks.loop(seconds=30)
+    async def activity_loop(self):
+        await self.flush_activity()
+
+    async def flush_activity(self):
+        if not self.pending_activity:
+            return
+
+        pending, self.pending_activity = self.pending_activity, {}
+        await db_thread(Activity.bulk_update, pending)
+        self.stored_activity.update(pending)
 
     async def on_message(self, message: Message):
         if message.author.bot or message.guild is None:
             return
 
-        await db_thread(Activity.update, message.author.id, message.created_at)
+        user_id: int = message.author.id
+        timestamp: datetime = message.created_at
+        granularity: int = await Settings.get(int, "activity_granularity", 60)
+        stored: Optional[datetime] = self.stored_activity.get(user_id)
+        if stored is not None and (timestamp - stored).total_seconds() < granularity:
+            return
+
+        self.pending_activity[user_id] = max(self.pending_activity.get(user_id, timestamp), timestamp)
 
     @commands.command()
     @Permission.scan_messages.check
     @guild_only()
+    @in_lane(Lane.BACKGROUND)
     async def scan(self, ctx: Context, days: int):
         """
         scan all channels for latest message of each user
@@ -78,11 +112,10 @@ class InactivityCog(Cog, name="Inactivity"):
 
         message: Message = await ctx.send(translations.updating_members)
 
-        def update_members():
-            for member, last_message in members.items():
-                Activity.update(member.id, last_message)
-
-        await db_thread(update_members)
+        activity = {member.id: last_message for member, last_message in members.items()}
+        await self.flush_activity()
+        await db_thread(Activity.bulk_update, activity)
+        self.stored_activity.update(activity)
         await ignore(message).edit(content=translations.f_updated_members(len(members)))
 
     @commands.command()
@@ -101,6 +134,7 @@ class InactivityCog(Cog, name="Inactivity"):
         embed = Embed(title=translations.user_info, color=0x35992C)
         embed.set_author(name=f"{user} ({user.id})", icon_url=user.avatar_url)
 
+        await self.flush_activity()
         last_message: Optional[datetime] = await last_activity(user)
         if user.bot:
             status = translations.status_bot
@@ -130,6 +164,7 @@ class InactivityCog(Cog, name="Inactivity"):
         elif days <= 0:
             raise CommandError(translations.invalid_duration)
 
+        await self.flush_activity()
         out = []
         now = datetime.utcnow()
         activity = {a.user_id: a.last_message for a in await db_thread(db.all, Activity)}
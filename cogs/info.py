@@ -1,21 +1,27 @@
 import re
+from functools import partial
 from typing import Optional, List
 
-from PyDrocsid.settings import Settings
 from PyDrocsid.translations import translations
 from discord import Embed, Guild, Status, Game, Member, Message
 from discord import Role
 from discord.ext import commands
 from discord.ext.commands import Cog, Bot, guild_only, Context, UserInputError
 
+from settings import Settings
+from startup_plan import StartupPlan
+
 
 class InfoCog(Cog, name="Server Information"):
     def __init__(self, bot: Bot):
         self.bot = bot
         self.current_status = 0
 
-    async def on_ready(self):
-        await self.bot.change_presence(status=Status.online, activity=Game(name=translations.profile_status))
+    async def on_startup_plan(self, plan: StartupPlan):
+        plan.add(
+            "presence",
+            partial(self.bot.change_presence, status=Status.online, activity=Game(name=translations.profile_status)),
+        )
 
     async def on_message(self, message: Message):
         if message.guild is None:
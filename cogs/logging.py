@@ -1,5 +1,7 @@
+import asyncio
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Set
+from typing import Optional, Set, Dict, List, Iterable, Tuple
 
 from discord import (
     TextChannel,
@@ -7,19 +9,26 @@ from discord import (
     Embed,
     RawMessageDeleteEvent,
     Member,
+    Object,
+    NotFound,
+    User,
 )
 from discord.ext import commands, tasks
 from discord.ext.commands import Cog, Bot, guild_only, Context, CommandError, UserInputError
 
-from PyDrocsid.database import db_thread
-from PyDrocsid.settings import Settings
 from PyDrocsid.translations import translations
-from PyDrocsid.util import calculate_edit_distance
-from models.log_exclude import LogExclude
+from log_archive import log_archive
+from log_dispatcher import log_dispatcher
+from message_cache import message_cache, CachedMessage
+from metrics import register_gauge
+from models.log_exclude import excluded_channels, load_excluded_channels, exclude_channel, unexclude_channel
+from outbound import in_lane, Lane
 from permissions import Permission
-from util import send_to_changelog
+from settings import Settings
+from util import send_to_changelog, bounded_edit_distance, ExpiringSet, code
 
-ignored_messages: Set[int] = set()
+ignored_messages = ExpiringSet(ttl=3600, max_size=10000)
+register_gauge("logging_ignored_messages", lambda: len(ignored_messages))
 
 
 def ignore(message: Message) -> Message:
@@ -39,52 +48,136 @@ def add_field(embed: Embed, name: str, text: str):
         first = False
 
 
+def format_attachments(attachments: Iterable[Tuple[str, int]]) -> str:
+    out = []
+    for filename, size in attachments:
+        for unit in "BKMG":
+            if size < 1000:
+                break
+            size /= 1000
+        out.append(f"{filename} ({size:.1f} {unit})")
+    return "\n".join(out)
+
+
+def format_archived_event(record: dict) -> str:
+    timestamp = datetime.utcfromtimestamp(record["time"]).strftime("%d.%m.%Y %H:%M:%S")
+    channel = f"<#{record['channel']}>"
+    author = f"<@{record['author']}>" if record["author"] is not None else "?"
+    content = code(record["content"][:100]) if record["content"] is not None else code(record["message"])
+    if record["event"] == "edit":
+        return translations.f_log_search_edited(timestamp, channel, author, content, code(record["new_content"][:100]))
+    return translations.f_log_search_deleted(timestamp, channel, author, content)
+
+
+LOGGING_EVENTS = ["edit", "delete", "changelog", "memberleave"]
+
+# discord rejects bulk deletes of messages older than 14 days, keep a margin for slow runs
+BULK_DELETE_MAXAGE = timedelta(days=14) - timedelta(hours=1)
+SINGLE_DELETE_DELAY = 1
+SEARCH_LIMIT = 50
+
+
 class LoggingCog(Cog, name="Logging"):
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.routes: Dict[str, TextChannel] = {}
+        self.logging_channels: Set[int] = set()
 
-    async def get_logging_channel(self, event: str) -> Optional[TextChannel]:
-        return self.bot.get_channel(await Settings.get(int, "logging_" + event, -1))
+    async def update_routes(self):
+        routes = {}
+        for event in LOGGING_EVENTS:
+            if (channel := self.bot.get_channel(await Settings.get(int, "logging_" + event, -1))) is not None:
+                routes[event] = channel
+        self.routes = routes
+        self.logging_channels = {channel.id for channel in routes.values()}
 
-    async def is_logging_channel(self, channel: TextChannel) -> bool:
-        return channel.id in [(await self.get_logging_channel(event)).id for event in ["edit", "delete"]]
+    def get_logging_channel(self, event: str) -> Optional[TextChannel]:
+        return self.routes.get(event)
+
+    def is_logging_channel(self, channel: TextChannel) -> bool:
+        return channel.id in self.logging_channels
 
     async def on_ready(self):
+        await self.update_routes()
+        await load_excluded_channels()
+
         try:
             self.cleanup_loop.start()
         except RuntimeError:
             self.cleanup_loop.restart()
 
     @tasks.loop(minutes=30)
+    @in_lane(Lane.BACKGROUND)
     async def cleanup_loop(self):
         days: int = await Settings.get(int, "logging_maxage", -1)
         if days == -1:
             return
 
+        # archived edits and deletions are not kept longer than the log messages
+        await log_archive.prune(time.time() - days * 24 * 60 * 60)
+
         timestamp = datetime.utcnow() - timedelta(days=days)
         for event in ["edit", "delete"]:
-            channel: Optional[TextChannel] = await self.get_logging_channel(event)
+            channel: Optional[TextChannel] = self.get_logging_channel(event)
             if channel is None:
                 continue
 
-            async for message in channel.history(limit=None, oldest_first=True):  # type: Message
-                if message.created_at > timestamp:
-                    break
+            await self.cleanup_channel(channel, timestamp)
+
+    async def cleanup_channel(self, channel: TextChannel, timestamp: datetime):
+        # everything up to the cursor has already been deleted by a previous run
+        key = f"logging_cleanup_cursor_{channel.id}"
+        cursor: Optional[int] = await Settings.get(int, key)
+        bulk_limit = datetime.utcnow() - BULK_DELETE_MAXAGE
+        batch: List[Message] = []
+
+        async def delete_batch():
+            try:
+                await channel.delete_messages(batch)
+            except NotFound:
+                pass
+            await Settings.set(int, key, batch[-1].id)
+            batch.clear()
+
+        after = Object(cursor) if cursor is not None else None
+        async for message in channel.history(limit=None, after=after, oldest_first=True):  # type: Message
+            if message.created_at > timestamp:
+                break
+
+            if message.created_at > bulk_limit:
+                batch.append(message)
+                if len(batch) == 100:
+                    await delete_batch()
+                continue
 
+            try:
                 await message.delete()
+            except NotFound:
+                pass
+            await Settings.set(int, key, message.id)
+            await asyncio.sleep(SINGLE_DELETE_DELAY)
+
+        if batch:
+            await delete_batch()
+
+    async def on_message(self, message: Message):
+        if message.guild is not None:
+            message_cache.put(message)
 
     async def on_message_edit(self, before: Message, after: Message):
         if before.guild is None:
             return
+        message_cache.put(after)
         if before.id in ignored_messages:
             ignored_messages.remove(before.id)
             return
         mindiff: int = await Settings.get(int, "logging_edit_mindiff", 1)
-        if calculate_edit_distance(before.content, after.content) < mindiff:
+        if bounded_edit_distance(before.content, after.content, mindiff) < mindiff:
             return
-        if (edit_channel := await self.get_logging_channel("edit")) is None:
+        if after.channel.id in excluded_channels:
             return
-        if await db_thread(LogExclude.exists, after.channel.id):
+        log_archive.append("edit", after.channel.id, after.author.id, after.id, before.content, after.content)
+        if (edit_channel := self.get_logging_channel("edit")) is None:
             return
 
         embed = Embed(title=translations.message_edited, color=0xFFFF00, timestamp=datetime.utcnow())
@@ -93,38 +186,45 @@ class LoggingCog(Cog, name="Logging"):
         embed.add_field(name=translations.url, value=before.jump_url, inline=False)
         add_field(embed, translations.old_content, before.content)
         add_field(embed, translations.new_content, after.content)
-        await edit_channel.send(embed=embed)
+        log_dispatcher.send(edit_channel, embed)
 
-    async def on_raw_message_edit(self, channel: TextChannel, message: Optional[Message]):
+    async def on_raw_message_edit(self, channel: TextChannel, message: Message):
         if message.guild is None:
             return
+        cached: Optional[CachedMessage] = await message_cache.get(message.id)
+        message_cache.put(message)
         if message.id in ignored_messages:
             ignored_messages.remove(message.id)
             return
-        if (edit_channel := await self.get_logging_channel("edit")) is None:
+        if message.channel.id in excluded_channels:
             return
-        if await db_thread(LogExclude.exists, message.channel.id):
+        old_content = cached.text if cached is not None else None
+        log_archive.append("edit", channel.id, message.author.id, message.id, old_content, message.content)
+        if (edit_channel := self.get_logging_channel("edit")) is None:
             return
 
         embed = Embed(title=translations.message_edited, color=0xFFFF00, timestamp=datetime.utcnow())
         embed.add_field(name=translations.channel, value=channel.mention)
-        if message is not None:
-            embed.add_field(name=translations.author_title, value=message.author.mention)
-            embed.add_field(name=translations.url, value=message.jump_url, inline=False)
-            add_field(embed, translations.new_content, message.content)
-        await edit_channel.send(embed=embed)
+        embed.add_field(name=translations.author_title, value=message.author.mention)
+        embed.add_field(name=translations.url, value=message.jump_url, inline=False)
+        if old_content is not None:
+            add_field(embed, translations.old_content, old_content)
+        add_field(embed, translations.new_content, message.content)
+        log_dispatcher.send(edit_channel, embed)
 
     async def on_message_delete(self, message: Message):
         if message.guild is None:
             return
+        await message_cache.pop(message.id)
         if message.id in ignored_messages:
             ignored_messages.remove(message.id)
             return
-        if (delete_channel := await self.get_logging_channel("delete")) is None:
+        if self.is_logging_channel(message.channel):
             return
-        if await self.is_logging_channel(message.channel):
+        if message.channel.id in excluded_channels:
             return
-        if await db_thread(LogExclude.exists, message.channel.id):
+        log_archive.append("delete", message.channel.id, message.author.id, message.id, message.content)
+        if (delete_channel := self.get_logging_channel("delete")) is None:
             return
 
         embed = Embed(title=translations.message_deleted, color=0xFF0000, timestamp=(datetime.utcnow()))
@@ -132,40 +232,46 @@ class LoggingCog(Cog, name="Logging"):
         embed.add_field(name=translations.author_title, value=message.author.mention)
         add_field(embed, translations.old_content, message.content)
         if message.attachments:
-            out = []
-            for attachment in message.attachments:
-                size = attachment.size
-                for unit in "BKMG":
-                    if size < 1000:
-                        break
-                    size /= 1000
-                out.append(f"{attachment.filename} ({size:.1f} {unit})")
-            embed.add_field(name=translations.attachments, value="\n".join(out), inline=False)
-        await delete_channel.send(embed=embed)
+            attachments = [(attachment.filename, attachment.size) for attachment in message.attachments]
+            embed.add_field(name=translations.attachments, value=format_attachments(attachments), inline=False)
+        line = translations.f_deleted_message_line(message.author.mention, message.content[:200] or "-")
+        log_dispatcher.send(delete_channel, embed, message.channel.id, line)
 
     async def on_raw_message_delete(self, event: RawMessageDeleteEvent):
         if event.guild_id is None:
             return
+        cached: Optional[CachedMessage] = await message_cache.pop(event.message_id)
         if event.message_id in ignored_messages:
             ignored_messages.remove(event.message_id)
             return
-        if (delete_channel := await self.get_logging_channel("delete")) is None:
+        if event.channel_id in excluded_channels or event.channel_id in self.logging_channels:
             return
-        if await db_thread(LogExclude.exists, event.channel_id):
+        if cached is not None:
+            log_archive.append("delete", event.channel_id, cached.author_id, event.message_id, cached.text)
+        else:
+            log_archive.append("delete", event.channel_id, None, event.message_id, None)
+        if (delete_channel := self.get_logging_channel("delete")) is None:
             return
 
         embed = Embed(title=translations.message_deleted, color=0xFF0000, timestamp=datetime.utcnow())
         channel: Optional[TextChannel] = self.bot.get_channel(event.channel_id)
         if channel is not None:
-            if await self.is_logging_channel(channel):
-                return
-
             embed.add_field(name=translations.channel, value=channel.mention)
+        if cached is not None:
+            embed.add_field(name=translations.author_title, value=cached.author_mention)
+            add_field(embed, translations.old_content, cached.text)
+            if cached.attachments:
+                embed.add_field(
+                    name=translations.attachments, value=format_attachments(cached.attachments), inline=False
+                )
+            line = translations.f_deleted_message_line(cached.author_mention, cached.text[:200] or "-")
+        else:
             embed.add_field(name=translations.message_id, value=event.message_id, inline=False)
-        await delete_channel.send(embed=embed)
+            line = translations.f_deleted_message_id_line(event.message_id)
+        log_dispatcher.send(delete_channel, embed, event.channel_id, line)
 
     async def on_member_remove(self, member: Member):
-        if (log_channel := await self.get_logging_channel("memberleave")) is None:
+        if (log_channel := self.get_logging_channel("memberleave")) is None:
             return
 
         await log_channel.send(translations.f_member_left_server(member))
@@ -183,10 +289,10 @@ class LoggingCog(Cog, name="Logging"):
                 raise UserInputError
             return
 
-        edit_channel: Optional[TextChannel] = await self.get_logging_channel("edit")
-        delete_channel: Optional[TextChannel] = await self.get_logging_channel("delete")
-        changelog_channel: Optional[TextChannel] = await self.get_logging_channel("changelog")
-        memberleave_channel: Optional[TextChannel] = await self.get_logging_channel("memberleave")
+        edit_channel: Optional[TextChannel] = self.get_logging_channel("edit")
+        delete_channel: Optional[TextChannel] = self.get_logging_channel("delete")
+        changelog_channel: Optional[TextChannel] = self.get_logging_channel("changelog")
+        memberleave_channel: Optional[TextChannel] = self.get_logging_channel("memberleave")
         maxage: int = await Settings.get(int, "logging_maxage", -1)
 
         embed = Embed(title=translations.logging, color=0x256BE6)
@@ -270,6 +376,7 @@ class LoggingCog(Cog, name="Logging"):
             raise CommandError(translations.log_not_changed_no_permissions)
 
         await Settings.set(int, "logging_edit", channel.id)
+        await self.update_routes()
         await ctx.send(translations.f_log_edit_updated(channel.mention))
         await send_to_changelog(ctx.guild, translations.f_log_edit_updated(channel.mention))
 
@@ -280,6 +387,7 @@ class LoggingCog(Cog, name="Logging"):
         """
 
         await Settings.set(int, "logging_edit", -1)
+        await self.update_routes()
         await ctx.send(translations.log_edit_disabled)
         await send_to_changelog(ctx.guild, translations.log_edit_disabled)
 
@@ -302,6 +410,7 @@ class LoggingCog(Cog, name="Logging"):
             raise CommandError(translations.log_not_changed_no_permissions)
 
         await Settings.set(int, "logging_delete", channel.id)
+        await self.update_routes()
         await ctx.send(translations.f_log_delete_updated(channel.mention))
         await send_to_changelog(ctx.guild, translations.f_log_delete_updated(channel.mention))
 
@@ -312,6 +421,7 @@ class LoggingCog(Cog, name="Logging"):
         """
 
         await Settings.set(int, "logging_delete", -1)
+        await self.update_routes()
         await ctx.send(translations.log_delete_disabled)
         await send_to_changelog(ctx.guild, translations.log_delete_disabled)
 
@@ -334,6 +444,7 @@ class LoggingCog(Cog, name="Logging"):
             raise CommandError(translations.log_not_changed_no_permissions)
 
         await Settings.set(int, "logging_changelog", channel.id)
+        await self.update_routes()
         await ctx.send(translations.f_log_changelog_updated(channel.mention))
         await send_to_changelog(ctx.guild, translations.f_log_changelog_updated(channel.mention))
 
@@ -345,6 +456,7 @@ class LoggingCog(Cog, name="Logging"):
 
         await send_to_changelog(ctx.guild, translations.log_changelog_disabled)
         await Settings.set(int, "logging_changelog", -1)
+        await self.update_routes()
         await ctx.send(translations.log_changelog_disabled)
 
     @logging.group(name="memberleave", aliases=["ml", "leave"])
@@ -366,6 +478,7 @@ class LoggingCog(Cog, name="Logging"):
             raise CommandError(translations.log_not_changed_no_permissions)
 
         await Settings.set(int, "logging_memberleave", channel.id)
+        await self.update_routes()
         await ctx.send(translations.f_log_memberleave_updated(channel.mention))
         await send_to_changelog(ctx.guild, translations.f_log_memberleave_updated(channel.mention))
 
@@ -376,6 +489,7 @@ class LoggingCog(Cog, name="Logging"):
         """
 
         await Settings.set(int, "logging_memberleave", -1)
+        await self.update_routes()
         await ctx.send(translations.log_memberleave_disabled)
         await send_to_changelog(ctx.guild, translations.log_memberleave_disabled)
 
@@ -392,10 +506,10 @@ class LoggingCog(Cog, name="Logging"):
 
         embed = Embed(title=translations.excluded_channels, colour=0x256BE6)
         out = []
-        for channel_id in await db_thread(LogExclude.all):
+        for channel_id in sorted(excluded_channels):
             channel: Optional[TextChannel] = self.bot.get_channel(channel_id)
             if channel is None:
-                await db_thread(LogExclude.remove, channel_id)
+                await unexclude_channel(channel_id)
             else:
                 out.append(f":small_blue_diamond: {channel.mention}")
         if not out:
@@ -411,10 +525,10 @@ class LoggingCog(Cog, name="Logging"):
         exclude a channel from logging
         """
 
-        if await db_thread(LogExclude.exists, channel.id):
+        if channel.id in excluded_channels:
             raise CommandError(translations.already_excluded)
 
-        await db_thread(LogExclude.add, channel.id)
+        await exclude_channel(channel.id)
         await ctx.send(translations.excluded)
         await send_to_changelog(ctx.guild, translations.f_log_excluded(channel.mention))
 
@@ -424,9 +538,49 @@ class LoggingCog(Cog, name="Logging"):
         remove a channel from exclude list
         """
 
-        if not await db_thread(LogExclude.exists, channel.id):
+        if channel.id not in excluded_channels:
             raise CommandError(translations.not_excluded)
 
-        await db_thread(LogExclude.remove, channel.id)
+        await unexclude_channel(channel.id)
         await ctx.send(translations.unexcluded)
         await send_to_changelog(ctx.guild, translations.f_log_unexcluded(channel.mention))
+
+    @logging.command(name="search", aliases=["s", "find"])
+    async def logging_search(
+        self,
+        ctx: Context,
+        channel: Optional[TextChannel],
+        user: Optional[User],
+        days: Optional[int],
+        *,
+        text: Optional[str],
+    ):
+        """
+        search archived edit and delete events by channel, author, age in days and content
+        """
+
+        if not log_archive.enabled:
+            raise CommandError(translations.log_archive_disabled)
+
+        since = time.time() - days * 24 * 60 * 60 if days is not None else None
+        found = 0
+        lines: List[str] = []
+
+        async def send_page():
+            await ctx.send(embed=Embed(title=translations.log_search, description="\n".join(lines), colour=0x256BE6))
+            lines.clear()
+
+        async for record in log_archive.search(channel and channel.id, user and user.id, since, text):
+            lines.append(format_archived_event(record))
+            found += 1
+            if len(lines) == 10:
+                await send_page()
+            if found == SEARCH_LIMIT:
+                break
+
+        if lines:
+            await send_page()
+        if not found:
+            await ctx.send(translations.log_search_no_results)
+        elif found == SEARCH_LIMIT:
+            await ctx.send(translations.f_log_search_limit(SEARCH_LIMIT))
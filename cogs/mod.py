@@ -1,18 +1,39 @@
 import re
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import datetime
+from functools import partial
 from typing import Optional, Union, List, Tuple
 
-from discord import Role, Guild, Member, Forbidden, HTTPException, User, Embed, NotFound
-from discord.ext import commands, tasks
+from discord import Role, Guild, Member, Forbidden, HTTPException, User, Embed, NotFound, Object
+from discord.ext import commands
 from discord.ext.commands import Cog, Bot, guild_only, Context, CommandError, Converter, BadArgument, UserInputError
 from discord.utils import snowflake_time
 
 from PyDrocsid.database import db_thread, db
-from PyDrocsid.settings import Settings
 from PyDrocsid.translations import translations
 from PyDrocsid.util import send_long_embed
-from models.mod import Join, Mute, Ban, Leave, UsernameUpdate, Report, Warn, Kick
+from batch_writer import BatchWriter
+from expiry_scheduler import ExpiryScheduler
+from metrics import register_gauge
+from models.mod import (
+    Join,
+    Mute,
+    Ban,
+    Leave,
+    UsernameUpdate,
+    Report,
+    Warn,
+    Kick,
+    user_stats,
+    UserStats,
+    user_timeline,
+    TimelineKey,
+)
+from outbound import in_lane, Lane
 from permissions import Permission
+from role_changes import role_changes
+from settings import Settings
+from startup_plan import StartupPlan
 from util import send_to_changelog, get_prefix, is_teamler, code, codeblock
 
 
@@ -29,6 +50,10 @@ class DurationConverter(Converter):
         return days
 
 
+TIMELINE_PAGE_SIZE = 100
+STATS_CACHE_SIZE = 1000
+
+
 async def get_mute_role(guild: Guild) -> Role:
     mute_role: Optional[Role] = guild.get_role(await Settings.get(int, "mute_role"))
     if mute_role is None:
@@ -42,72 +67,152 @@ async def update_join_date(guild: Guild, user_id: int):
         await db_thread(Join.update, member.id, str(member), member.joined_at)
 
 
+def format_timeline_entry(row) -> str:
+    kind = row.kind
+    if kind == "join":
+        return translations.ulog_joined
+    if kind == "leave":
+        return translations.ulog_left
+    if kind == "username_update":
+        if not row.number:
+            return translations.f_ulog_username_updated(code(row.text), code(row.new_text))
+        if row.text is None:
+            return translations.f_ulog_nick_set(code(row.new_text))
+        if row.new_text is None:
+            return translations.f_ulog_nick_cleared(code(row.text))
+        return translations.f_ulog_nick_updated(code(row.text), code(row.new_text))
+    if kind == "report":
+        return translations.f_ulog_reported(f"<@{row.actor}>", code(row.text))
+    if kind == "warn":
+        return translations.f_ulog_warned(f"<@{row.actor}>", code(row.text))
+    if kind == "mute":
+        if row.number == -1:
+            return translations.f_ulog_muted_inf(f"<@{row.actor}>", code(row.text))
+        return translations.f_ulog_muted(f"<@{row.actor}>", row.number, code(row.text))
+    if kind == "unmute":
+        if row.actor is None:
+            return translations.ulog_unmuted_expired
+        return translations.f_ulog_unmuted(f"<@{row.actor}>", code(row.text))
+    if kind == "kick":
+        if row.actor is None:
+            return translations.ulog_autokicked
+        return translations.f_ulog_kicked(f"<@{row.actor}>", code(row.text))
+    if kind == "ban":
+        if row.number == -1:
+            return translations.f_ulog_banned_inf(f"<@{row.actor}>", code(row.text))
+        return translations.f_ulog_banned(f"<@{row.actor}>", row.number, code(row.text))
+    if row.actor is None:
+        return translations.ulog_unbanned_expired
+    return translations.f_ulog_unbanned(f"<@{row.actor}>", code(row.text))
+
+
 class ModCog(Cog, name="Mod Tools"):
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.journal = BatchWriter()
+        register_gauge("journal_queue_depth", lambda: self.journal.queue_depth)
+        register_gauge("journal_rows_written", lambda: self.journal.written)
+        self.expirations = ExpiryScheduler(self.expire)
+        register_gauge("mod_pending_expirations", lambda: len(self.expirations.due))
+        self.stats_cache: "OrderedDict[int, UserStats]" = OrderedDict()
+        self.stats_generation = 0
+        register_gauge("mod_stats_cache_entries", lambda: len(self.stats_cache))
+
+    def invalidate_stats(self, *user_ids: int):
+        self.stats_generation += 1
+        for user_id in user_ids:
+            self.stats_cache.pop(user_id, None)
+
+    async def get_user_stats(self, user_id: int) -> UserStats:
+        if (stats := self.stats_cache.get(user_id)) is not None:
+            self.stats_cache.move_to_end(user_id)
+            return stats
+
+        generation = self.stats_generation
+        stats = await db_thread(user_stats, user_id)
+        # a sanction created while the query was running might not be included
+        if generation == self.stats_generation:
+            self.stats_cache[user_id] = stats
+            while len(self.stats_cache) > STATS_CACHE_SIZE:
+                self.stats_cache.popitem(last=False)
+        return stats
 
     async def on_ready(self):
+        self.expirations.clear()
+        for ban in await db_thread(Ban.pending):
+            self.expirations.schedule(("ban", ban.id), ban.expires_at)
+        for mute in await db_thread(Mute.pending):
+            self.expirations.schedule(("mute", mute.id), mute.expires_at)
+        self.expirations.start()
+
+    async def on_startup_plan(self, plan: StartupPlan):
         guild: Guild = self.bot.guilds[0]
         mute_role: Optional[Role] = guild.get_role(await Settings.get(int, "mute_role"))
-        if mute_role is not None:
-            for mute in await db_thread(db.query, Mute, active=True):
-                member: Optional[Member] = guild.get_member(mute.member)
-                if member is not None:
-                    await member.add_roles(mute_role)
+        if mute_role is None:
+            return
 
-        try:
-            self.mod_loop.start()
-        except RuntimeError:
-            self.mod_loop.restart()
+        for mute in await db_thread(db.query, Mute, active=True):
+            member: Optional[Member] = guild.get_member(mute.member)
+            if member is not None and mute_role not in member.roles:
+                plan.add("mute_roles", partial(role_changes.add_roles, member, mute_role, immediate=True))
 
-    @tasks.loop(minutes=30)
-    async def mod_loop(self):
+    @in_lane(Lane.BACKGROUND)
+    async def expire(self, key: Tuple[str, int]):
+        kind, row_id = key
         guild: Guild = self.bot.guilds[0]
 
-        for ban in await db_thread(db.query, Ban, active=True):
-            if ban.days != -1 and datetime.utcnow() >= ban.timestamp + timedelta(days=ban.days):
-                user: Optional[User] = await self.bot.fetch_user(ban.member)
-                if user is not None:
-                    await guild.unban(user)
-                await send_to_changelog(
-                    guild, translations.f_log_unbanned_expired(f"<@{ban.member}>", code(ban.member_name))
-                )
-                await db_thread(Ban.deactivate, ban.id)
+        if kind == "ban":
+            ban: Optional[Ban] = await db_thread(db.get, Ban, row_id)
+            if ban is None or not ban.active:
+                return
 
-        mute_role: Optional[Role] = guild.get_role(await Settings.get(int, "mute_role"))
-        if mute_role is None:
+            try:
+                await guild.unban(Object(ban.member))
+            except NotFound:  # ban has already been removed manually
+                pass
+            await send_to_changelog(
+                guild, translations.f_log_unbanned_expired(f"<@{ban.member}>", code(ban.member_name))
+            )
+            await db_thread(Ban.deactivate, ban.id)
+            self.invalidate_stats(ban.member)
             return
 
-        for mute in await db_thread(db.query, Mute, active=True):
-            if mute.days != -1 and datetime.utcnow() >= mute.timestamp + timedelta(days=mute.days):
-                member: Optional[Member] = guild.get_member(mute.member)
-                if member is not None:
-                    await member.remove_roles(mute_role)
-                await send_to_changelog(
-                    guild, translations.f_log_unmuted_expired(f"<@{mute.member}>", code(mute.member_name))
-                )
-                await db_thread(Mute.deactivate, mute.id)
+        mute: Optional[Mute] = await db_thread(db.get, Mute, row_id)
+        if mute is None or not mute.active:
+            return
+
+        mute_role: Optional[Role] = guild.get_role(await Settings.get(int, "mute_role"))
+        member: Optional[Member] = guild.get_member(mute.member)
+        if member is not None and mute_role is not None:
+            await role_changes.remove_roles(member, mute_role, immediate=True)
+        await send_to_changelog(guild, translations.f_log_unmuted_expired(f"<@{mute.member}>", code(mute.member_name)))
+        await db_thread(Mute.deactivate, mute.id)
+        self.invalidate_stats(mute.member)
+
+    async def on_shutdown(self):
+        await self.expirations.stop()
+        await self.journal.close()
 
     async def on_member_join(self, member: Member):
-        await db_thread(Join.create, member.id, str(member))
+        await self.journal.add(Join.build(member.id, str(member)))
         mute_role: Optional[Role] = member.guild.get_role(await Settings.get(int, "mute_role"))
         if mute_role is None:
             return
 
         if await db_thread(db.first, Mute, active=True, member=member.id) is not None:
-            await member.add_roles(mute_role)
+            await role_changes.add_roles(member, mute_role, immediate=True)
 
     async def on_member_remove(self, member: Member):
-        await db_thread(Leave.create, member.id, str(member))
+        await self.journal.add(Leave.build(member.id, str(member)))
 
     async def on_member_nick_update(self, before: Member, after: Member):
-        await db_thread(UsernameUpdate.create, before.id, before.nick, after.nick, True)
+        await self.journal.add(UsernameUpdate.build(before.id, before.nick, after.nick, True))
 
     async def on_user_update(self, before: User, after: User):
         if str(before) == str(after):
             return
 
-        await db_thread(UsernameUpdate.create, before.id, str(before), str(after), False)
+        await self.journal.add(UsernameUpdate.build(before.id, str(before), str(after), False))
 
     @commands.command()
     @guild_only()
@@ -120,6 +225,7 @@ class ModCog(Cog, name="Mod Tools"):
             raise CommandError(translations.reason_too_long)
 
         await db_thread(Report.create, member.id, str(member), ctx.author.id, reason)
+        self.invalidate_stats(member.id, ctx.author.id)
         await ctx.send(translations.reported_response)
         await send_to_changelog(
             ctx.guild, translations.f_log_reported(ctx.author.mention, member.mention, code(member), code(reason))
@@ -144,6 +250,7 @@ class ModCog(Cog, name="Mod Tools"):
         except (Forbidden, HTTPException):
             await ctx.send(translations.no_dm)
         await db_thread(Warn.create, member.id, str(member), ctx.author.id, reason)
+        self.invalidate_stats(member.id, ctx.author.id)
         await ctx.send(translations.warned_response)
         await send_to_changelog(
             ctx.guild, translations.f_log_warned(ctx.author.mention, member.mention, code(member), code(reason))
@@ -182,7 +289,7 @@ class ModCog(Cog, name="Mod Tools"):
         if isinstance(user, Member):
             if mute_role in user.roles:
                 raise CommandError(translations.already_muted)
-            await user.add_roles(mute_role)
+            await role_changes.add_roles(user, mute_role, immediate=True)
 
         try:
             if days is not None:
@@ -192,13 +299,16 @@ class ModCog(Cog, name="Mod Tools"):
         except (Forbidden, HTTPException):
             await ctx.send(translations.no_dm)
         if days is not None:
-            await db_thread(Mute.create, user.id, str(user), ctx.author.id, days, reason)
+            mute: Mute = await db_thread(Mute.create, user.id, str(user), ctx.author.id, days, reason)
+            self.invalidate_stats(user.id, ctx.author.id)
+            self.expirations.schedule(("mute", mute.id), mute.expires_at)
             await ctx.send(translations.muted_response)
             await send_to_changelog(
                 ctx.guild, translations.f_log_muted(ctx.author.mention, user.mention, code(user), days, code(reason))
             )
         else:
             await db_thread(Mute.create, user.id, str(user), ctx.author.id, -1, reason)
+            self.invalidate_stats(user.id, ctx.author.id)
             await ctx.send(translations.muted_response)
             await send_to_changelog(
                 ctx.guild, translations.f_log_muted_inf(ctx.author.mention, user.mention, code(user), code(reason))
@@ -221,10 +331,12 @@ class ModCog(Cog, name="Mod Tools"):
         was_muted = False
         if isinstance(user, Member) and mute_role in user.roles:
             was_muted = True
-            await user.remove_roles(mute_role)
+            await role_changes.remove_roles(user, mute_role, immediate=True)
 
         for mute in await db_thread(db.query, Mute, active=True, member=user.id):
             await db_thread(Mute.deactivate, mute.id, ctx.author.id, reason)
+            self.invalidate_stats(user.id)
+            self.expirations.cancel(("mute", mute.id))
             was_muted = True
         if not was_muted:
             raise CommandError(translations.not_muted)
@@ -260,6 +372,7 @@ class ModCog(Cog, name="Mod Tools"):
             await ctx.send(translations.no_dm)
         await member.kick(reason=reason)
         await db_thread(Kick.create, member.id, str(member), ctx.author.id, reason)
+        self.invalidate_stats(member.id, ctx.author.id)
         await ctx.send(translations.kicked_response)
         await send_to_changelog(
             ctx.guild, translations.f_log_kicked(ctx.author.mention, member.mention, code(member), code(reason))
@@ -299,13 +412,16 @@ class ModCog(Cog, name="Mod Tools"):
 
         await ctx.guild.ban(user, delete_message_days=1, reason=reason)
         if days is not None:
-            await db_thread(Ban.create, user.id, str(user), ctx.author.id, days, reason)
+            ban: Ban = await db_thread(Ban.create, user.id, str(user), ctx.author.id, days, reason)
+            self.invalidate_stats(user.id, ctx.author.id)
+            self.expirations.schedule(("ban", ban.id), ban.expires_at)
             await ctx.send(translations.banned_response)
             await send_to_changelog(
                 ctx.guild, translations.f_log_banned(ctx.author.mention, user.mention, code(user), days, code(reason))
             )
         else:
             await db_thread(Ban.create, user.id, str(user), ctx.author.id, -1, reason)
+            self.invalidate_stats(user.id, ctx.author.id)
             await ctx.send(translations.banned_response)
             await send_to_changelog(
                 ctx.guild, translations.f_log_banned_inf(ctx.author.mention, user.mention, code(user), code(reason))
@@ -336,6 +452,8 @@ class ModCog(Cog, name="Mod Tools"):
         for ban in await db_thread(db.query, Ban, active=True, member=user.id):
             was_banned = True
             await db_thread(Ban.deactivate, ban.id, ctx.author.id, reason)
+            self.invalidate_stats(user.id)
+            self.expirations.cancel(("ban", ban.id))
         if not was_banned:
             raise CommandError(translations.not_banned)
 
@@ -375,7 +493,6 @@ class ModCog(Cog, name="Mod Tools"):
         """
 
         user, user_id, arg_passed = await self.get_stats_user(ctx, user)
-        await update_join_date(self.bot.guilds[0], user_id)
 
         embed = Embed(title=translations.stats, color=0x35992C)
         if isinstance(user, int):
@@ -383,34 +500,22 @@ class ModCog(Cog, name="Mod Tools"):
         else:
             embed.set_author(name=f"{user} ({user_id})", icon_url=user.avatar_url)
 
-        async def count(cls):
-            if cls is Report:
-                active = await db_thread(db.count, cls, reporter=user_id)
-            else:
-                active = await db_thread(db.count, cls, mod=user_id)
-            passive = await db_thread(db.count, cls, member=user_id)
-            return translations.f_active_passive(active, passive)
-
-        embed.add_field(name=translations.reported_cnt, value=await count(Report))
-        embed.add_field(name=translations.warned_cnt, value=await count(Warn))
-        embed.add_field(name=translations.muted_cnt, value=await count(Mute))
-        embed.add_field(name=translations.kicked_cnt, value=await count(Kick))
-        embed.add_field(name=translations.banned_cnt, value=await count(Ban))
-
-        if (ban := await db_thread(db.first, Ban, member=user_id, active=True)) is not None:
-            if ban.days != -1:
-                expiry_date: datetime = ban.timestamp + timedelta(days=ban.days)
-                days_left = (expiry_date - datetime.utcnow()).days + 1
-                status = translations.f_status_banned_days(ban.days, days_left)
-            else:
-                status = translations.status_banned
-        elif (mute := await db_thread(db.first, Mute, member=user_id, active=True)) is not None:
-            if mute.days != -1:
-                expiry_date: datetime = mute.timestamp + timedelta(days=mute.days)
-                days_left = (expiry_date - datetime.utcnow()).days + 1
-                status = translations.f_status_muted_days(mute.days, days_left)
+        counts, sanction = await self.get_user_stats(user_id)
+        embed.add_field(name=translations.reported_cnt, value=translations.f_active_passive(*counts["report"]))
+        embed.add_field(name=translations.warned_cnt, value=translations.f_active_passive(*counts["warn"]))
+        embed.add_field(name=translations.muted_cnt, value=translations.f_active_passive(*counts["mute"]))
+        embed.add_field(name=translations.kicked_cnt, value=translations.f_active_passive(*counts["kick"]))
+        embed.add_field(name=translations.banned_cnt, value=translations.f_active_passive(*counts["ban"]))
+        if sanction is not None:
+            kind, days, expires_at = sanction
+            if expires_at is not None:
+                days_left = (expires_at - datetime.utcnow()).days + 1
+                if kind == "ban":
+                    status = translations.f_status_banned_days(days, days_left)
+                else:
+                    status = translations.f_status_muted_days(days, days_left)
             else:
-                status = translations.status_muted
+                status = translations.status_banned if kind == "ban" else translations.status_muted
         elif (member := self.bot.guilds[0].get_member(user_id)) is not None:
             status = translations.f_member_since(member.joined_at.strftime("%d.%m.%Y %H:%M:%S"))
         else:
@@ -433,86 +538,43 @@ class ModCog(Cog, name="Mod Tools"):
         """
 
         user, user_id, arg_passed = await self.get_stats_user(ctx, user)
+        await self.journal.flush()
         await update_join_date(self.bot.guilds[0], user_id)
 
-        out: List[Tuple[datetime, str]] = [(snowflake_time(user_id), translations.ulog_created)]
-        for join in await db_thread(db.query, Join, member=user_id):
-            out.append((join.timestamp, translations.ulog_joined))
-        for leave in await db_thread(db.query, Leave, member=user_id):
-            out.append((leave.timestamp, translations.ulog_left))
-        for username_update in await db_thread(db.query, UsernameUpdate, member=user_id):
-            if not username_update.nick:
-                msg = translations.f_ulog_username_updated(
-                    code(username_update.member_name), code(username_update.new_name)
-                )
-            elif username_update.member_name is None:
-                msg = translations.f_ulog_nick_set(code(username_update.new_name))
-            elif username_update.new_name is None:
-                msg = translations.f_ulog_nick_cleared(code(username_update.member_name))
-            else:
-                msg = translations.f_ulog_nick_updated(
-                    code(username_update.member_name), code(username_update.new_name)
-                )
-            out.append((username_update.timestamp, msg))
-        for report in await db_thread(db.query, Report, member=user_id):
-            out.append((report.timestamp, translations.f_ulog_reported(f"<@{report.reporter}>", code(report.reason))))
-        for warn in await db_thread(db.query, Warn, member=user_id):
-            out.append((warn.timestamp, translations.f_ulog_warned(f"<@{warn.mod}>", code(warn.reason))))
-        for mute in await db_thread(db.query, Mute, member=user_id):
-            if mute.days == -1:
-                out.append((mute.timestamp, translations.f_ulog_muted_inf(f"<@{mute.mod}>", code(mute.reason))))
-            else:
-                out.append((mute.timestamp, translations.f_ulog_muted(f"<@{mute.mod}>", mute.days, code(mute.reason))))
-            if not mute.active:
-                if mute.unmute_mod is None:
-                    out.append((mute.deactivation_timestamp, translations.ulog_unmuted_expired))
-                else:
-                    out.append(
-                        (
-                            mute.deactivation_timestamp,
-                            translations.f_ulog_unmuted(f"<@{mute.unmute_mod}>", code(mute.unmute_reason)),
-                        )
-                    )
-        for kick in await db_thread(db.query, Kick, member=user_id):
-            if kick.mod is not None:
-                out.append((kick.timestamp, translations.f_ulog_kicked(f"<@{kick.mod}>", code(kick.reason))))
-            else:
-                out.append((kick.timestamp, translations.ulog_autokicked))
-        for ban in await db_thread(db.query, Ban, member=user_id):
-            if ban.days == -1:
-                out.append((ban.timestamp, translations.f_ulog_banned_inf(f"<@{ban.mod}>", code(ban.reason))))
-            else:
-                out.append((ban.timestamp, translations.f_ulog_banned(f"<@{ban.mod}>", ban.days, code(ban.reason))))
-            if not ban.active:
-                if ban.unban_mod is None:
-                    out.append((ban.deactivation_timestamp, translations.ulog_unbanned_expired))
-                else:
-                    out.append(
-                        (
-                            ban.deactivation_timestamp,
-                            translations.f_ulog_unbanned(f"<@{ban.unban_mod}>", code(ban.unban_reason)),
-                        )
-                    )
-
-        out.sort()
         embed = Embed(title=translations.userlogs, color=0x34B77E)
         if isinstance(user, int):
             embed.set_author(name=str(user))
         else:
             embed.set_author(name=f"{user} ({user_id})", icon_url=user.avatar_url)
-        for row in out:
-            name = row[0].strftime("%d.%m.%Y %H:%M:%S")
-            value = row[1]
-            embed.add_field(name=name, value=value, inline=False)
-
         embed.set_footer(text=translations.utc_note)
-        if arg_passed:
-            await send_long_embed(ctx, embed)
-        else:
-            try:
-                await send_long_embed(ctx.author, embed)
-            except (Forbidden, HTTPException):
-                raise CommandError(translations.could_not_send_dm)
+
+        async def send_page(entries: List[Tuple[datetime, str]]):
+            page = embed.copy()
+            for timestamp, text in entries:
+                page.add_field(name=timestamp.strftime("%d.%m.%Y %H:%M:%S"), value=text, inline=False)
+            await send_long_embed(ctx if arg_passed else ctx.author, page)
+            embed.title = ""
+            embed.remove_author()
+
+        # only one page of the timeline is held in memory at a time
+        entries: List[Tuple[datetime, str]] = [(snowflake_time(user_id), translations.ulog_created)]
+        key: Optional[TimelineKey] = None
+        try:
+            while True:
+                rows = await db_thread(user_timeline, user_id, key, TIMELINE_PAGE_SIZE)
+                entries += [(row.timestamp, format_timeline_entry(row)) for row in rows]
+                if entries:
+                    await send_page(entries)
+                if len(rows) < TIMELINE_PAGE_SIZE:
+                    break
+                key = rows[-1].timestamp, rows[-1].kind, rows[-1].id
+                entries = []
+        except (Forbidden, HTTPException):
+            if arg_passed:
+                raise
+            raise CommandError(translations.could_not_send_dm)
+
+        if not arg_passed:
             await ctx.message.add_reaction("\u2705")
 
     @commands.command()
@@ -530,5 +592,6 @@ class ModCog(Cog, name="Mod Tools"):
                 Join.update(member.id, str(member), member.joined_at)
 
         await ctx.send(translations.f_filling_join_log(len(guild.members)))
+        await self.journal.flush()
         await db_thread(init)
         await ctx.send(translations.join_log_filled)
@@ -2,11 +2,11 @@ from typing import Optional
 
 from PyDrocsid.translations import translations
 from PyDrocsid.util import send_long_embed
-from discord import Embed
+from discord import Embed, Member
 from discord.ext import commands
 from discord.ext.commands import Cog, Bot, guild_only, Context, CommandError, UserInputError
 
-from permissions import Permission, PermissionLevel, PermissionLevelConverter
+from permissions import Permission, PermissionLevel, PermissionLevelConverter, invalidate_permission_levels
 
 
 async def list_permissions(ctx: Context, title: str, min_level: PermissionLevel):
@@ -33,6 +33,15 @@ class PermissionsCog(Cog, name="Permissions"):
     def __init__(self, bot: Bot):
         self.bot = bot
 
+    async def on_member_role_add(self, member: Member, _):
+        invalidate_permission_levels(member.id)
+
+    async def on_member_role_remove(self, member: Member, _):
+        invalidate_permission_levels(member.id)
+
+    async def on_member_remove(self, member: Member):
+        invalidate_permission_levels(member.id)
+
     @commands.group(aliases=["perm", "p"])
     @guild_only()
     async def permissions(self, ctx: Context):
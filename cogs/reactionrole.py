@@ -10,6 +10,7 @@ from discord.ext.commands import Cog, Bot, guild_only, Context, CommandError, Us
 
 from models.reactionrole import ReactionRole
 from permissions import Permission
+from role_changes import role_changes
 from util import send_to_changelog
 
 
@@ -42,9 +43,9 @@ class ReactionRoleCog(Cog, name="ReactionRole"):
 
         try:
             if link.reverse:
-                await member.remove_roles(role)
+                await role_changes.remove_roles(member, role)
             else:
-                await member.add_roles(role)
+                await role_changes.add_roles(member, role)
             if link.auto_remove:
                 await message.remove_reaction(emoji, member)
         except NotFound:
@@ -64,9 +65,9 @@ class ReactionRoleCog(Cog, name="ReactionRole"):
 
         try:
             if link.reverse:
-                await member.add_roles(role)
+                await role_changes.add_roles(member, role)
             else:
-                await member.remove_roles(role)
+                await role_changes.remove_roles(member, role)
         except NotFound:
             pass
         raise StopEventHandling
@@ -1,7 +1,6 @@
 from typing import Optional, Union, Dict, List
 
 from PyDrocsid.database import db_thread, db
-from PyDrocsid.settings import Settings
 from PyDrocsid.translations import translations
 from PyDrocsid.util import send_long_embed
 from discord import Role, Embed, Member
@@ -9,7 +8,9 @@ from discord.ext import commands
 from discord.ext.commands import Cog, Bot, CommandError, Context, guild_only, UserInputError
 
 from models.role_auth import RoleAuth
-from permissions import PermissionLevel, Permission
+from permissions import PermissionLevel, Permission, invalidate_permission_levels
+from role_changes import role_changes
+from settings import Settings
 from util import send_to_changelog, code
 
 
@@ -20,6 +21,7 @@ async def configure_role(ctx: Context, role_name: str, role: Role, check_assigna
         if role.managed:
             raise CommandError(translations.f_role_not_set_managed_role(role))
     await Settings.set(int, role_name + "_role", role.id)
+    invalidate_permission_levels()
     await ctx.send(translations.role_set)
     await send_to_changelog(
         ctx.guild, translations.f_log_role_set(translations.role_names[role_name], role.name, role.id),
@@ -148,7 +150,7 @@ class RolesCog(Cog, name="Roles"):
         if not await is_authorized(ctx.author, role):
             raise CommandError(translations.role_not_authorized)
 
-        await member.add_roles(role)
+        await role_changes.add_roles(member, role, immediate=True)
         await ctx.message.add_reaction("\u2705")
 
     @roles.command(name="remove", aliases=["r", "del", "d", "-"])
@@ -160,7 +162,7 @@ class RolesCog(Cog, name="Roles"):
         if not await is_authorized(ctx.author, role):
             raise CommandError(translations.role_not_authorized)
 
-        await member.remove_roles(role)
+        await role_changes.remove_roles(member, role, immediate=True)
         await ctx.message.add_reaction("\u2705")
 
     @roles.command(name="list", aliases=["l", "?"])
@@ -1,19 +1,22 @@
 import random
 import re
+from functools import partial
 from typing import Optional, Union, Tuple, List, Dict, Set
 
-from discord import CategoryChannel, PermissionOverwrite, NotFound, Message, Embed
+from discord import CategoryChannel, PermissionOverwrite, Message, Embed
 from discord import Member, VoiceState, Guild, VoiceChannel, Role, HTTPException, TextChannel
 from discord.ext import commands
 from discord.ext.commands import Cog, Bot, guild_only, Context, CommandError, UserInputError
 
 from PyDrocsid.database import db_thread, db
 from PyDrocsid.multilock import MultiLock
-from PyDrocsid.settings import Settings
 from PyDrocsid.translations import translations
 from models.dynamic_voice import DynamicVoiceChannel, DynamicVoiceGroup
 from models.role_voice_link import RoleVoiceLink
 from permissions import Permission
+from role_changes import role_changes
+from settings import Settings
+from startup_plan import StartupPlan
 from util import get_prefix, send_to_changelog
 
 
@@ -54,9 +57,8 @@ class VoiceChannelCog(Cog, name="Voice Channels"):
         embed = Embed(title=title, color=[0x256BE6, 0x03AD28][public], description=msg)
         await channel.send(embed=embed)
 
-    async def on_ready(self):
+    async def on_startup_plan(self, plan: StartupPlan):
         guild: Guild = self.bot.guilds[0]
-        print(translations.updating_voice_roles)
         linked_roles: Dict[Role, Set[VoiceChannel]] = {}
         for link in await db_thread(db.all, RoleVoiceLink):
             role = guild.get_role(link.role)
@@ -80,31 +82,32 @@ class VoiceChannelCog(Cog, name="Voice Channels"):
                 members.update(channel.members)
             for member in members:
                 if role not in member.roles:
-                    await member.add_roles(role)
+                    plan.add("voice_roles", partial(role_changes.add_roles, member, role, immediate=True))
             for member in role.members:
                 if member not in members:
-                    await member.remove_roles(role)
+                    plan.add("voice_roles", partial(role_changes.remove_roles, member, role, immediate=True))
 
         for group in await db_thread(db.all, DynamicVoiceGroup):
-            channel: Optional[VoiceChannel] = guild.get_channel(group.channel_id)
-            if channel is None:
-                continue
+            plan.add("dynamic_voice", partial(self.reconcile_dynamic_voice_group, group))
 
-            for member in channel.members:
-                group, dyn_channel = await get_group_channel(channel)
-                async with self.group_lock[group.id if group is not None else None]:
-                    await self.member_join(member, channel, group, dyn_channel)
+    async def reconcile_dynamic_voice_group(self, group: DynamicVoiceGroup):
+        channel: Optional[VoiceChannel] = self.bot.get_channel(group.channel_id)
+        if channel is None:
+            return
 
-            for dyn_channel in await db_thread(db.all, DynamicVoiceChannel, group_id=group.id):
-                channel: Optional[VoiceChannel] = guild.get_channel(dyn_channel.channel_id)
-                if channel is not None and all(member.bot for member in channel.members):
-                    await channel.delete()
-                    if (text_channel := self.bot.get_channel(dyn_channel.text_chat_id)) is not None:
-                        await text_channel.delete()
-                    await db_thread(db.delete, dyn_channel)
-            await self.update_dynamic_voice_group(group)
+        for member in channel.members:
+            group, dyn_channel = await get_group_channel(channel)
+            async with self.group_lock[group.id if group is not None else None]:
+                await self.member_join(member, channel, group, dyn_channel)
 
-        print(translations.voice_init_done)
+        for dyn_channel in await db_thread(db.all, DynamicVoiceChannel, group_id=group.id):
+            channel: Optional[VoiceChannel] = self.bot.get_channel(dyn_channel.channel_id)
+            if channel is not None and all(member.bot for member in channel.members):
+                await channel.delete()
+                if (text_channel := self.bot.get_channel(dyn_channel.text_chat_id)) is not None:
+                    await text_channel.delete()
+                await db_thread(db.delete, dyn_channel)
+        await self.update_dynamic_voice_group(group)
 
     async def get_dynamic_voice_channel(
         self, member: Member, owner_required: bool
@@ -136,11 +139,11 @@ class VoiceChannelCog(Cog, name="Voice Channels"):
         group: Optional[DynamicVoiceGroup],
         dyn_channel: Optional[DynamicVoiceChannel],
     ):
-        await member.add_roles(*await gather_roles(member.guild, channel.id))
+        await role_changes.add_roles(member, *await gather_roles(member.guild, channel.id))
 
         if dyn_channel is not None:
             if group is not None:
-                await member.add_roles(*await gather_roles(member.guild, group.channel_id))
+                await role_changes.add_roles(member, *await gather_roles(member.guild, group.channel_id))
 
             text_chat: Optional[TextChannel] = self.bot.get_channel(dyn_channel.text_chat_id)
             if text_chat is not None:
@@ -201,18 +204,12 @@ class VoiceChannelCog(Cog, name="Voice Channels"):
         group: Optional[DynamicVoiceGroup],
         dyn_channel: Optional[DynamicVoiceChannel],
     ):
-        try:
-            await member.remove_roles(*await gather_roles(member.guild, channel.id))
-        except NotFound:  # member left the server
-            pass
+        await role_changes.remove_roles(member, *await gather_roles(member.guild, channel.id))
 
         if dyn_channel is None or group is None:
             return
 
-        try:
-            await member.remove_roles(*await gather_roles(member.guild, group.channel_id))
-        except NotFound:  # member left the server
-            pass
+        await role_changes.remove_roles(member, *await gather_roles(member.guild, group.channel_id))
 
         text_chat: Optional[TextChannel] = self.bot.get_channel(dyn_channel.text_chat_id)
         if text_chat is not None:
@@ -377,7 +374,7 @@ class VoiceChannelCog(Cog, name="Voice Channels"):
 
         roles = await gather_roles(voice_channel.guild, group.channel_id)
         for member in voice_channel.members:
-            await member.remove_roles(*roles)
+            await role_changes.remove_roles(member, *roles)
 
         if text_channel is not None:
             await text_channel.delete()
@@ -506,7 +503,7 @@ class VoiceChannelCog(Cog, name="Voice Channels"):
 
         await db_thread(RoleVoiceLink.create, role.id, channel.id)
         for member in channel.members:
-            await member.add_roles(role)
+            await role_changes.add_roles(member, role)
 
         group: Optional[DynamicVoiceGroup] = await db_thread(db.first, DynamicVoiceGroup, channel_id=channel.id)
         if group is not None:
@@ -514,7 +511,7 @@ class VoiceChannelCog(Cog, name="Voice Channels"):
                 dchannel: Optional[VoiceChannel] = self.bot.get_channel(dyn_channel.channel_id)
                 if dchannel is not None:
                     for member in dchannel.members:
-                        await member.add_roles(role)
+                        await role_changes.add_roles(member, role)
 
         await ctx.send(translations.f_link_created(channel, role))
         await send_to_changelog(ctx.guild, translations.f_link_created(channel, role))
@@ -530,7 +527,7 @@ class VoiceChannelCog(Cog, name="Voice Channels"):
 
         await db_thread(db.delete, link)
         for member in channel.members:
-            await member.remove_roles(role)
+            await role_changes.remove_roles(member, role)
 
         group: Optional[DynamicVoiceGroup] = await db_thread(db.first, DynamicVoiceGroup, channel_id=channel.id)
         if group is not None:
@@ -538,7 +535,7 @@ class VoiceChannelCog(Cog, name="Voice Channels"):
                 dchannel: Optional[VoiceChannel] = self.bot.get_channel(dyn_channel.channel_id)
                 if dchannel is not None:
                     for member in dchannel.members:
-                        await member.remove_roles(role)
+                        await role_changes.remove_roles(member, role)
 
         await ctx.send(translations.link_deleted)
         await send_to_changelog(ctx.guild, translations.f_log_link_deleted(channel, role))
@@ -0,0 +1,83 @@
+import asyncio
+import heapq
+import traceback
+from datetime import datetime, timedelta
+from itertools import count
+from typing import Callable, Awaitable, Hashable, List, Tuple, Dict, Optional
+
+
+class ExpiryScheduler:
+    def __init__(
+        self, callback: Callable[[Hashable], Awaitable[None]], retry_delay: float = 60, max_retry_delay: float = 1800
+    ):
+        self.callback = callback
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.heap: List[Tuple[datetime, int, Hashable]] = []
+        self.due: Dict[Hashable, datetime] = {}
+        self.failures: Dict[Hashable, int] = {}
+        self.counter = count()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def schedule(self, key: Hashable, due: datetime):
+        self.due[key] = due
+        heapq.heappush(self.heap, (due, next(self.counter), key))
+        self.wakeup.set()
+
+    def cancel(self, key: Hashable):
+        # the heap entry is dropped lazily once it reaches the top
+        self.due.pop(key, None)
+        self.failures.pop(key, None)
+
+    def retry(self, key: Hashable):
+        failures = self.failures[key] = self.failures.get(key, 0) + 1
+        delay = min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+        self.schedule(key, datetime.utcnow() + timedelta(seconds=delay))
+
+    def clear(self):
+        self.heap.clear()
+        self.due.clear()
+        self.failures.clear()
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        while True:
+            while self.heap and self.due.get(self.heap[0][2]) != self.heap[0][0]:
+                heapq.heappop(self.heap)
+
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+
+            due, _, key = self.heap[0]
+            if (delay := (due - datetime.utcnow()).total_seconds()) > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # the key stays in self.due while the callback runs, so a cancel or reschedule in the meantime is seen
+            heapq.heappop(self.heap)
+            try:
+                await self.callback(key)
+            except Exception:  # skipcq: PYL-W0703
+                traceback.print_exc()
+                if self.due.get(key) == due:
+                    self.retry(key)
+                continue
+
+            if self.due.get(key) == due:
+                del self.due[key]
+                self.failures.pop(key, None)
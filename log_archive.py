@@ -0,0 +1,293 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+import traceback
+import zlib
+from datetime import timedelta
+from threading import Lock
+from typing import Optional, IO, List, Set, AsyncIterator, Tuple
+
+from PyDrocsid.async_thread import run_in_thread
+from PyDrocsid.events import listener
+
+from metrics import register_gauge
+
+
+class Segment:
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self.start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.channels: Set[int] = set()
+        self.authors: Set[int] = set()
+
+    @property
+    def index_path(self) -> str:
+        return self.path + ".idx"
+
+    def add(self, record: dict):
+        self.count += 1
+        self.start = record["time"] if self.start is None else self.start
+        self.end = record["time"]
+        self.channels.add(record["channel"])
+        if record["author"] is not None:
+            self.authors.add(record["author"])
+
+    def matches(self, channel: Optional[int], author: Optional[int], since: Optional[float]) -> bool:
+        if not self.count:
+            return False
+        if channel is not None and channel not in self.channels:
+            return False
+        if author is not None and author not in self.authors:
+            return False
+        return since is None or self.end >= since
+
+    def save_index(self):
+        index = {
+            "count": self.count,
+            "start": self.start,
+            "end": self.end,
+            "channels": sorted(self.channels),
+            "authors": sorted(self.authors),
+        }
+        with open(self.index_path, "w") as file:
+            json.dump(index, file)
+
+    def load_index(self):
+        if not os.path.exists(self.index_path):
+            # the bot was not shut down cleanly while this segment was open
+            for record in self.read():
+                self.add(record)
+            self.save_index()
+            return
+
+        with open(self.index_path) as file:
+            index = json.load(file)
+        self.count, self.start, self.end = index["count"], index["start"], index["end"]
+        self.channels, self.authors = set(index["channels"]), set(index["authors"])
+
+    def read(self) -> List[dict]:
+        records = []
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as file:
+                for line in file:
+                    records.append(json.loads(line))
+        except (EOFError, zlib.error, json.JSONDecodeError):
+            pass  # truncated tail of an unclean shutdown
+        except OSError:
+            traceback.print_exc()
+        return records
+
+
+class LogArchive:
+    def __init__(self, segment_size: int = 10000, max_age: Optional[timedelta] = timedelta(days=30)):
+        self.segment_size = segment_size
+        self.max_age = max_age
+        self.directory: Optional[str] = None
+        self.segments: List[Segment] = []
+        self.pending: List[Tuple[Segment, str]] = []
+        self.write_task: Optional[asyncio.Task] = None
+        # the segment file that is open for appending, only touched by the writer thread
+        self.lock = Lock()
+        self.file: Optional[IO[str]] = None
+        self.file_segment: Optional[Segment] = None
+        self.archived = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def open(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".jsonl.gz"):
+                segment = Segment(os.path.join(directory, name))
+                segment.load_index()
+                if segment.count:
+                    self.segments.append(segment)
+                else:
+                    os.remove(segment.path)
+                    os.remove(segment.index_path)
+        self.rotate()
+
+    def rotate(self):
+        # numbered after the newest segment, the count is smaller once old segments have been pruned
+        number = int(os.path.basename(self.segments[-1].path)[:6]) + 1 if self.segments else 0
+        name = f"{number:06d}-{int(time.time())}.jsonl.gz"
+        self.segments.append(Segment(os.path.join(self.directory, name)))
+
+    def append(
+        self,
+        event: str,
+        channel: int,
+        author: Optional[int],
+        message: int,
+        content: Optional[str],
+        new_content: Optional[str] = None,
+    ):
+        if not self.enabled:
+            return
+
+        record = {
+            "time": round(time.time(), 3),
+            "event": event,
+            "channel": channel,
+            "author": author,
+            "message": message,
+            "content": content,
+            "new_content": new_content,
+        }
+        segment = self.segments[-1]
+        segment.add(record)
+        self.pending.append((segment, json.dumps(record, separators=(",", ":")) + "\n"))
+        self.archived += 1
+        if segment.count >= self.segment_size:
+            self.rotate()
+
+        if self.write_task is None:
+            self.write_task = asyncio.create_task(self.write_pending())
+
+    def write(self, lines: List[Tuple[Segment, str]]) -> bool:
+        """
+        append the lines to their segment files, return whether a segment has been completed
+        """
+
+        rotated = False
+        with self.lock:
+            try:
+                for segment, line in lines:
+                    if segment is not self.file_segment:
+                        rotated |= self.close_file()
+                        self.file = gzip.open(segment.path, "at", encoding="utf-8")
+                        self.file_segment = segment
+                    self.file.write(line)
+            except OSError:
+                traceback.print_exc()
+        return rotated
+
+    def close_file(self) -> bool:
+        if self.file is None:
+            return False
+
+        try:
+            self.file.close()
+            self.file_segment.save_index()
+        except OSError:
+            traceback.print_exc()
+        self.file = self.file_segment = None
+        return True
+
+    def finish(self):
+        with self.lock:
+            self.close_file()
+
+    def flush_file(self):
+        with self.lock:
+            try:
+                if self.file is not None:
+                    self.file.flush()
+            except OSError:
+                traceback.print_exc()
+
+    async def write_pending(self):
+        try:
+            while self.pending:
+                lines, self.pending = self.pending, []
+                if await run_in_thread(lambda: self.write(lines)):
+                    await self.prune()
+        finally:
+            self.write_task = None
+
+    async def drain(self):
+        if self.write_task is not None:
+            await self.write_task
+        await self.write_pending()
+
+    async def prune(self, before: Optional[float] = None):
+        """
+        delete completed segments older than max_age or, if given, whose newest record is older than before
+        """
+
+        cutoffs = [before] if before is not None else []
+        if self.max_age is not None:
+            cutoffs.append(time.time() - self.max_age.total_seconds())
+        if not cutoffs:
+            return
+
+        busy = {self.file_segment, *(segment for segment, _ in self.pending)}
+        expired = [
+            segment for segment in self.segments[:-1] if segment.end < max(cutoffs) and segment not in busy
+        ]
+        if not expired:
+            return
+
+        self.segments = [segment for segment in self.segments if segment not in expired]
+
+        def remove():
+            for segment in expired:
+                for path in [segment.path, segment.index_path]:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        traceback.print_exc()
+
+        await run_in_thread(remove)
+
+    async def search(
+        self,
+        channel: Optional[int] = None,
+        author: Optional[int] = None,
+        since: Optional[float] = None,
+        text: Optional[str] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        yield matching records, newest first, reading only segments whose index allows a match
+        """
+
+        text = text.lower() if text else None
+
+        def matches(record: dict) -> bool:
+            if channel is not None and record["channel"] != channel:
+                return False
+            if author is not None and record["author"] != author:
+                return False
+            if since is not None and record["time"] < since:
+                return False
+            if text is None:
+                return True
+            return any(text in (record[key] or "").lower() for key in ["content", "new_content"])
+
+        await self.drain()
+        await run_in_thread(self.flush_file)
+        for segment in reversed([*self.segments]):
+            if not segment.matches(channel, author, since):
+                continue
+
+            for record in reversed(await run_in_thread(lambda: [r for r in segment.read() if matches(r)])):
+                yield record
+
+            if since is not None and segment.start < since:
+                break
+
+    async def close(self):
+        if not self.enabled:
+            return
+
+        await self.drain()
+        await run_in_thread(self.finish)
+        self.directory = None
+
+
+log_archive = LogArchive()
+
+register_gauge("log_archive_records", lambda: log_archive.archived)
+register_gauge("log_archive_segments", lambda: len(log_archive.segments))
+
+
+@listener
+async def on_shutdown():
+    await log_archive.close()
@@ -0,0 +1,146 @@
+import asyncio
+import traceback
+from typing import Dict, List, Optional, Hashable
+
+from PyDrocsid.events import listener
+from PyDrocsid.translations import translations
+from discord import TextChannel, Embed, HTTPException
+
+from metrics import register_gauge
+
+MAX_FIELDS = 25
+MAX_LENGTH = 6000
+MAX_DESCRIPTION = 2048
+
+
+class LogEntry:
+    def __init__(self, embed: Embed, group: Optional[Hashable] = None, line: Optional[str] = None):
+        self.embed = embed
+        self.group = group
+        self.line = line
+
+
+class PendingLogs:
+    def __init__(self, channel: TextChannel):
+        self.channel = channel
+        self.entries: List[LogEntry] = []
+        self.flush_task: Optional[asyncio.Task] = None
+
+
+def merge(entries: List[LogEntry], max_entries: int) -> List[Embed]:
+    embeds: List[Embed] = []
+    current: Optional[Embed] = None
+    count = 0
+    for entry in entries:
+        embed = entry.embed
+        if (
+            current is None
+            or count >= max_entries
+            or (current.title, current.colour) != (embed.title, embed.colour)
+            or len(current.fields) + len(embed.fields) > MAX_FIELDS
+            or len(current) + len(embed) > MAX_LENGTH
+        ):
+            current = Embed(title=embed.title, colour=embed.colour, description=embed.description)
+            embeds.append(current)
+            count = 0
+
+        for field in embed.fields:
+            current.add_field(name=field.name, value=field.value, inline=field.inline)
+        current.timestamp = embed.timestamp
+        count += 1
+    return embeds
+
+
+def summarize(group: List[LogEntry]) -> List[Embed]:
+    chunks: List[List[str]] = [[]]
+    for entry in group:
+        line = entry.line[: MAX_DESCRIPTION // 4]
+        if chunks[-1] and len("\n".join(chunks[-1] + [line])) > MAX_DESCRIPTION:
+            chunks.append([])
+        chunks[-1].append(line)
+
+    first = group[0].embed
+    embeds: List[Embed] = []
+    for lines in chunks:
+        embed = Embed(
+            title=translations.f_messages_deleted(len(group)),
+            colour=first.colour,
+            description="\n".join(lines),
+            timestamp=group[-1].embed.timestamp,
+        )
+        for field in first.fields[:1]:
+            embed.add_field(name=field.name, value=field.value)
+        embeds.append(embed)
+    return embeds
+
+
+class LogDispatcher:
+    def __init__(self, delay: float = 2, max_entries: int = 10, summary_threshold: int = 5):
+        self.delay = delay
+        self.max_entries = max_entries
+        self.summary_threshold = summary_threshold
+        self.pending: Dict[int, PendingLogs] = {}
+        self.locks: Dict[int, asyncio.Lock] = {}
+        self.entries = 0
+        self.messages = 0
+
+    def send(self, channel: TextChannel, embed: Embed, group: Optional[Hashable] = None, line: Optional[str] = None):
+        if (pending := self.pending.get(channel.id)) is None:
+            pending = self.pending[channel.id] = PendingLogs(channel)
+            pending.flush_task = asyncio.create_task(self.delayed_flush(channel.id))
+
+        pending.entries.append(LogEntry(embed, group if line is not None else None, line))
+        self.entries += 1
+
+    def prepare(self, entries: List[LogEntry]) -> List[Embed]:
+        groups: Dict[Hashable, List[LogEntry]] = {}
+        for entry in entries:
+            if entry.group is not None:
+                groups.setdefault(entry.group, []).append(entry)
+
+        embeds: List[Embed] = []
+        run: List[LogEntry] = []
+        for entry in entries:
+            group = groups.get(entry.group)
+            if group is None or len(group) < self.summary_threshold:
+                run.append(entry)
+                continue
+
+            # a summary takes the place of the first deletion it covers
+            if group[0] is entry:
+                embeds += merge(run, self.max_entries) + summarize(group)
+                run = []
+        return embeds + merge(run, self.max_entries)
+
+    async def delayed_flush(self, channel_id: int):
+        await asyncio.sleep(self.delay)
+        await self.flush(channel_id)
+
+    async def flush(self, channel_id: int):
+        async with self.locks.setdefault(channel_id, asyncio.Lock()):
+            if (pending := self.pending.pop(channel_id, None)) is None:
+                return
+
+            for embed in self.prepare(pending.entries):
+                self.messages += 1
+                try:
+                    await pending.channel.send(embed=embed)
+                except HTTPException:
+                    traceback.print_exc()
+
+    async def close(self):
+        for channel_id, pending in [*self.pending.items()]:
+            pending.flush_task.cancel()
+            await self.flush(channel_id)
+
+
+log_dispatcher = LogDispatcher()
+
+register_gauge("log_dispatcher_entries", lambda: log_dispatcher.entries)
+register_gauge("log_dispatcher_messages", lambda: log_dispatcher.messages)
+register_gauge("log_dispatcher_pending", lambda: sum(len(p.entries) for p in log_dispatcher.pending.values()))
+
+
+@listener
+async def on_shutdown():
+    await log_dispatcher.close()
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import sqlite3
+import traceback
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import NamedTuple, Tuple, Optional, Dict, List, Set
+
+from PyDrocsid.async_thread import run_in_thread
+from PyDrocsid.events import listener
+from discord import Message
+from discord.utils import time_snowflake
+
+from metrics import register_gauge
+
+# approximate size of the tuple, the dict slot and the ints of one entry
+ENTRY_OVERHEAD = 200
+COMPRESS_THRESHOLD = 256
+
+
+class CachedMessage(NamedTuple):
+    channel_id: int
+    author_id: int
+    content: bytes
+    attachments: Tuple[Tuple[str, int], ...]
+
+    @staticmethod
+    def from_message(message: Message) -> "CachedMessage":
+        return CachedMessage(
+            message.channel.id,
+            message.author.id,
+            encode(message.content),
+            tuple((attachment.filename, attachment.size) for attachment in message.attachments),
+        )
+
+    @property
+    def text(self) -> str:
+        return decode(self.content)
+
+    @property
+    def author_mention(self) -> str:
+        return f"<@{self.author_id}>"
+
+    @property
+    def size(self) -> int:
+        return ENTRY_OVERHEAD + len(self.content) + sum(len(name) + 50 for name, _ in self.attachments)
+
+
+def encode(content: str) -> bytes:
+    data = content.encode()
+    if len(data) >= COMPRESS_THRESHOLD:
+        return b"z" + zlib.compress(data)
+    return b"r" + data
+
+
+def decode(content: bytes) -> str:
+    if content[:1] == b"z":
+        return zlib.decompress(content[1:]).decode()
+    return content[1:].decode()
+
+
+class MessageSpill:
+    def __init__(self, path: str, max_age: timedelta):
+        self.max_age = max_age
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY, channel_id INTEGER, author_id INTEGER, content BLOB, attachments TEXT)"
+        )
+
+    def write(self, entries: List[Tuple[int, CachedMessage]]):
+        rows = [
+            (message_id, entry.channel_id, entry.author_id, entry.content, json.dumps(entry.attachments))
+            for message_id, entry in entries
+        ]
+        try:
+            with self.lock, self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)", rows)
+                self.connection.execute(
+                    "DELETE FROM messages WHERE id < ?", (time_snowflake(datetime.utcnow() - self.max_age),)
+                )
+        except sqlite3.Error:
+            traceback.print_exc()
+
+    def delete(self, message_ids: List[int]):
+        try:
+            with self.lock, self.connection:
+                self.connection.executemany("DELETE FROM messages WHERE id = ?", [(i,) for i in message_ids])
+        except sqlite3.Error:
+            traceback.print_exc()
+
+    def take(self, message_id: int, remove: bool) -> Optional[CachedMessage]:
+        try:
+            with self.lock, self.connection:
+                row = self.connection.execute(
+                    "SELECT channel_id, author_id, content, attachments FROM messages WHERE id = ?", (message_id,)
+                ).fetchone()
+                if row is not None and remove:
+                    self.connection.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+        except sqlite3.Error:
+            traceback.print_exc()
+            return None
+        if row is None:
+            return None
+
+        channel_id, author_id, content, attachments = row
+        return CachedMessage(channel_id, author_id, content, tuple(map(tuple, json.loads(attachments))))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class MessageCache:
+    def __init__(self, max_size: int = 64 << 20, batch_size: int = 100):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.entries: "OrderedDict[int, CachedMessage]" = OrderedDict()
+        self.size = 0
+        self.spill: Optional[MessageSpill] = None
+        self.evicted: Dict[int, CachedMessage] = {}
+        # messages deleted while a batch of evicted messages is being written
+        self.deleted: Set[int] = set()
+        self.write_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.spilled = 0
+
+    def spill_to(self, path: str, max_age: timedelta = timedelta(days=30)):
+        self.spill = MessageSpill(path, max_age)
+
+    def store(self, message_id: int, entry: CachedMessage):
+        if (old := self.entries.pop(message_id, None)) is not None:
+            self.size -= old.size
+        self.entries[message_id] = entry
+        self.size += entry.size
+
+        while self.size > self.max_size:
+            evicted_id, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            if self.spill is not None:
+                self.evicted[evicted_id] = evicted
+
+        if len(self.evicted) >= self.batch_size and self.write_task is None:
+            self.write_task = asyncio.create_task(self.write_evicted())
+
+    def put(self, message: Message):
+        self.store(message.id, CachedMessage.from_message(message))
+
+    async def write_evicted(self):
+        try:
+            while self.evicted:
+                entries = [*self.evicted.items()]
+                await run_in_thread(lambda: self.spill.write(entries))
+                for message_id, entry in entries:
+                    if self.evicted.get(message_id) is entry:
+                        del self.evicted[message_id]
+                self.spilled += len(entries)
+
+                if deleted := [message_id for message_id, _ in entries if message_id in self.deleted]:
+                    await run_in_thread(lambda: self.spill.delete(deleted))
+                self.deleted.clear()
+        finally:
+            self.write_task = None
+
+    async def lookup(self, message_id: int, remove: bool) -> Optional[CachedMessage]:
+        if (entry := self.entries.get(message_id)) is not None:
+            if remove:
+                del self.entries[message_id]
+                self.size -= entry.size
+            else:
+                self.entries.move_to_end(message_id)
+        elif self.spill is not None and not remove:
+            if (entry := self.evicted.get(message_id)) is None:
+                entry = await run_in_thread(lambda: self.spill.take(message_id, False))
+
+        if remove and self.spill is not None:
+            # an older copy may be on disk even if the message is in memory, e.g. after an edit loaded it back
+            evicted = self.evicted.pop(message_id, None)
+            if self.write_task is not None:
+                self.deleted.add(message_id)
+            spilled = await run_in_thread(lambda: self.spill.take(message_id, True))
+            entry = entry or evicted or spilled
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    async def get(self, message_id: int) -> Optional[CachedMessage]:
+        return await self.lookup(message_id, False)
+
+    async def pop(self, message_id: int) -> Optional[CachedMessage]:
+        return await self.lookup(message_id, True)
+
+    async def close(self):
+        if self.spill is None:
+            return
+
+        if self.write_task is not None:
+            await self.write_task
+        await self.write_evicted()
+        self.spill.close()
+        self.spill = None
+
+
+message_cache = MessageCache()
+
+register_gauge("message_cache_entries", lambda: len(message_cache.entries))
+register_gauge("message_cache_bytes", lambda: message_cache.size)
+register_gauge("message_cache_hits", lambda: message_cache.hits)
+register_gauge("message_cache_misses", lambda: message_cache.misses)
+register_gauge("message_cache_spilled", lambda: message_cache.spilled)
+
+
+@listener
+async def on_shutdown():
+    await message_cache.close()
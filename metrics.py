@@ -0,0 +1,172 @@
+import time
+from asyncio import BoundedSemaphore
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Callable
+
+from aiohttp import web
+from discord.ext.commands import Bot, Context
+
+from PyDrocsid.database import db
+from PyDrocsid.events import event_handlers, StopEventHandling
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+current_handler = ContextVar("current_handler", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets: List[int] = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.buckets[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            if seen + count >= rank and count:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+
+class HandlerMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.latency = Histogram()
+        self.errors = 0
+        self.db_calls = 0
+        self.rest_calls = 0
+
+
+handlers: Dict[str, HandlerMetrics] = {}
+gauges: Dict[str, Callable[[], float]] = {}
+
+
+def get_handler(name: str) -> HandlerMetrics:
+    if (metrics := handlers.get(name)) is None:
+        metrics = handlers[name] = HandlerMetrics(name)
+    return metrics
+
+
+def register_gauge(name: str, func: Callable[[], float]):
+    gauges[name] = func
+
+
+def count_db_call():
+    if (metrics := current_handler.get()) is not None:
+        metrics.db_calls += 1
+
+
+def count_rest_call():
+    if (metrics := current_handler.get()) is not None:
+        metrics.rest_calls += 1
+
+
+class CountingSemaphore(BoundedSemaphore):
+    async def __aenter__(self):
+        count_db_call()
+        return await super().__aenter__()
+
+
+def instrument(name: str, func):
+    metrics = get_handler(name)
+
+    @wraps(func)
+    async def inner(*args, **kwargs):
+        token = current_handler.set(metrics)
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except StopEventHandling:
+            raise
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            metrics.latency.observe(time.perf_counter() - start)
+            current_handler.reset(token)
+
+    return inner
+
+
+def instrument_bot(bot: Bot):
+    for event, funcs in event_handlers.items():
+        funcs[:] = [instrument(f"{event}:{func.__qualname__}", func) for func in funcs]
+
+    db.thread_semaphore = CountingSemaphore(db.thread_semaphore._value)
+
+    request = bot.http.request
+
+    async def counted_request(*args, **kwargs):
+        count_rest_call()
+        return await request(*args, **kwargs)
+
+    bot.http.request = counted_request
+
+    @bot.before_invoke
+    async def before_command(ctx: Context):
+        metrics = get_handler(f"command:{ctx.command.qualified_name}")
+        ctx.metrics_token = current_handler.set(metrics)
+        ctx.metrics_start = time.perf_counter()
+
+    @bot.after_invoke
+    async def after_command(ctx: Context):
+        metrics = get_handler(f"command:{ctx.command.qualified_name}")
+        metrics.latency.observe(time.perf_counter() - ctx.metrics_start)
+        if ctx.command_failed:
+            metrics.errors += 1
+        current_handler.reset(ctx.metrics_token)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def render() -> str:
+    out = [
+        "# TYPE handler_latency_seconds histogram",
+        "# TYPE handler_errors_total counter",
+        "# TYPE handler_db_calls_total counter",
+        "# TYPE handler_rest_calls_total counter",
+    ]
+    for name, metrics in sorted(handlers.items()):
+        label = f'handler="{escape_label(name)}"'
+        cumulative = 0
+        for bound, count in zip([*map(str, BUCKETS), "+Inf"], metrics.latency.buckets):
+            cumulative += count
+            out.append(f'handler_latency_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        out.append(f"handler_latency_seconds_sum{{{label}}} {metrics.latency.sum}")
+        out.append(f"handler_latency_seconds_count{{{label}}} {metrics.latency.count}")
+        out.append(f"handler_errors_total{{{label}}} {metrics.errors}")
+        out.append(f"handler_db_calls_total{{{label}}} {metrics.db_calls}")
+        out.append(f"handler_rest_calls_total{{{label}}} {metrics.rest_calls}")
+    for name, func in sorted(gauges.items()):
+        out.append(f"# TYPE {name} gauge")
+        out.append(f"{name} {func()}")
+    return "\n".join(out) + "\n"
+
+
+async def handle_metrics(_) -> web.Response:
+    return web.Response(text=render())
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,32 @@
+from sqlalchemy import inspect
+
+from PyDrocsid.database import db
+from models.mod import Join, Leave, UsernameUpdate, Report, Warn, Mute, Kick, Ban, expiry_date
+
+
+def add_expires_at(model):
+    inspector = inspect(db.engine)
+    table = model.__table__
+    if "expires_at" not in {column["name"] for column in inspector.get_columns(table.name)}:
+        db.engine.execute(f"ALTER TABLE {table.name} ADD COLUMN expires_at DATETIME NULL")
+        try:
+            for row in db.query(model).filter(model.days != -1):
+                row.expires_at = expiry_date(row.timestamp, row.days)
+            db.session.commit()
+        finally:
+            db.close()
+
+
+def create_indexes(model):
+    table = model.__table__
+    existing = {index["name"] for index in inspect(db.engine).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(bind=db.engine)
+
+
+def migrate():
+    for model in [Mute, Ban]:
+        add_expires_at(model)
+    for model in [Join, Leave, UsernameUpdate, Report, Warn, Mute, Kick, Ban]:
+        create_indexes(model)
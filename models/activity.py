@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Union
+from typing import Union, Dict
 
 from PyDrocsid.database import db
 from sqlalchemy import Column, BigInteger, DateTime
@@ -24,3 +24,12 @@ class Activity(db.Base):
         else:
             row.last_message = last_message
         return row
+
+    @staticmethod
+    def bulk_update(activity: Dict[int, datetime]):
+        rows = {row.user_id: row for row in db.query(Activity).filter(Activity.user_id.in_(activity))}
+        for user_id, last_message in activity.items():
+            if (row := rows.get(user_id)) is None:
+                Activity.create(user_id, last_message)
+            else:
+                row.last_message = last_message
@@ -1,8 +1,26 @@
-from typing import Union, List
+from typing import Union, List, Set
 
 from sqlalchemy import Column, BigInteger
 
-from PyDrocsid.database import db
+from PyDrocsid.database import db, db_thread
+
+excluded_channels: Set[int] = set()
+
+
+async def load_excluded_channels():
+    channels = await db_thread(LogExclude.all)
+    excluded_channels.clear()
+    excluded_channels.update(channels)
+
+
+async def exclude_channel(channel_id: int):
+    await db_thread(LogExclude.add, channel_id)
+    excluded_channels.add(channel_id)
+
+
+async def unexclude_channel(channel_id: int):
+    await db_thread(LogExclude.remove, channel_id)
+    excluded_channels.discard(channel_id)
 
 
 class LogExclude(db.Base):
@@ -1,21 +1,49 @@
 from datetime import datetime, timedelta
-from typing import Union, Optional
-
-from sqlalchemy import Column, Integer, BigInteger, DateTime, Text, Boolean
+from typing import Union, Optional, List, Tuple, Dict
+
+from sqlalchemy import (
+    Column,
+    Integer,
+    BigInteger,
+    DateTime,
+    Text,
+    Boolean,
+    Index,
+    select,
+    literal,
+    union_all,
+    null,
+    tuple_,
+    func,
+)
 
 from PyDrocsid.database import db
 
 
+def expiry_date(timestamp: datetime, days: int) -> Optional[datetime]:
+    if days == -1:
+        return None
+    try:
+        return timestamp + timedelta(days=days)
+    except OverflowError:
+        return datetime(9999, 12, 31)
+
+
 class Join(db.Base):
     __tablename__ = "join"
+    __table_args__ = (Index("ix_join_member_timestamp", "member", "timestamp"),)
     id: Union[Column, int] = Column(Integer, primary_key=True, unique=True, autoincrement=True)
     member: Union[Column, int] = Column(BigInteger)
     member_name: Union[Column, str] = Column(Text(collation="utf8mb4_bin"))
     timestamp: Union[Column, datetime] = Column(DateTime)
 
+    @staticmethod
+    def build(member: int, member_name: str, timestamp: Optional[datetime] = None) -> "Join":
+        return Join(member=member, member_name=member_name, timestamp=timestamp or datetime.utcnow())
+
     @staticmethod
     def create(member: int, member_name: str, timestamp: Optional[datetime] = None) -> "Join":
-        row = Join(member=member, member_name=member_name, timestamp=timestamp or datetime.utcnow())
+        row = Join.build(member, member_name, timestamp)
         db.add(row)
         return row
 
@@ -30,20 +58,26 @@ class Join(db.Base):
 
 class Leave(db.Base):
     __tablename__ = "leave"
+    __table_args__ = (Index("ix_leave_member_timestamp", "member", "timestamp"),)
     id: Union[Column, int] = Column(Integer, primary_key=True, unique=True, autoincrement=True)
     member: Union[Column, int] = Column(BigInteger)
     member_name: Union[Column, str] = Column(Text(collation="utf8mb4_bin"))
     timestamp: Union[Column, datetime] = Column(DateTime)
 
+    @staticmethod
+    def build(member: int, member_name: str) -> "Leave":
+        return Leave(member=member, member_name=member_name, timestamp=datetime.utcnow())
+
     @staticmethod
     def create(member: int, member_name: str) -> "Leave":
-        row = Leave(member=member, member_name=member_name, timestamp=datetime.utcnow())
+        row = Leave.build(member, member_name)
         db.add(row)
         return row
 
 
 class UsernameUpdate(db.Base):
     __tablename__ = "username_update"
+    __table_args__ = (Index("ix_username_update_member_timestamp", "member", "timestamp"),)
 
     id: Union[Column, int] = Column(Integer, primary_key=True, unique=True, autoincrement=True)
     member: Union[Column, int] = Column(BigInteger)
@@ -53,16 +87,21 @@ class UsernameUpdate(db.Base):
     timestamp: Union[Column, datetime] = Column(DateTime)
 
     @staticmethod
-    def create(member: int, member_name: str, new_name: str, nick: bool) -> "UsernameUpdate":
-        row = UsernameUpdate(
+    def build(member: int, member_name: str, new_name: str, nick: bool) -> "UsernameUpdate":
+        return UsernameUpdate(
             member=member, member_name=member_name, new_name=new_name, nick=nick, timestamp=datetime.utcnow()
         )
+
+    @staticmethod
+    def create(member: int, member_name: str, new_name: str, nick: bool) -> "UsernameUpdate":
+        row = UsernameUpdate.build(member, member_name, new_name, nick)
         db.add(row)
         return row
 
 
 class Report(db.Base):
     __tablename__ = "report"
+    __table_args__ = (Index("ix_report_member_timestamp", "member", "timestamp"),)
 
     id: Union[Column, int] = Column(Integer, primary_key=True, unique=True, autoincrement=True)
     member: Union[Column, int] = Column(BigInteger)
@@ -82,6 +121,7 @@ class Report(db.Base):
 
 class Warn(db.Base):
     __tablename__ = "warn"
+    __table_args__ = (Index("ix_warn_member_timestamp", "member", "timestamp"),)
 
     id: Union[Column, int] = Column(Integer, primary_key=True, unique=True, autoincrement=True)
     member: Union[Column, int] = Column(BigInteger)
@@ -99,6 +139,10 @@ class Warn(db.Base):
 
 class Mute(db.Base):
     __tablename__ = "mute"
+    __table_args__ = (
+        Index("ix_mute_active_expires_at", "active", "expires_at"),
+        Index("ix_mute_member_active", "member", "active"),
+    )
 
     id: Union[Column, int] = Column(Integer, primary_key=True, unique=True, autoincrement=True)
     member: Union[Column, int] = Column(BigInteger)
@@ -111,20 +155,23 @@ class Mute(db.Base):
     deactivation_timestamp: Union[Column, Optional[datetime]] = Column(DateTime, nullable=True)
     unmute_mod: Union[Column, Optional[int]] = Column(BigInteger, nullable=True)
     unmute_reason: Union[Column, Optional[str]] = Column(Text(collation="utf8mb4_bin"), nullable=True)
+    expires_at: Union[Column, Optional[datetime]] = Column(DateTime, nullable=True)
 
     @staticmethod
     def create(member: int, member_name: str, mod: int, days: int, reason: str) -> "Mute":
+        timestamp = datetime.utcnow()
         row = Mute(
             member=member,
             member_name=member_name,
             mod=mod,
-            timestamp=datetime.utcnow(),
+            timestamp=timestamp,
             days=days,
             reason=reason,
             active=True,
             deactivation_timestamp=None,
             unmute_mod=None,
             unmute_reason=None,
+            expires_at=expiry_date(timestamp, days),
         )
         db.add(row)
         return row
@@ -137,9 +184,14 @@ class Mute(db.Base):
         row.unmute_mod = unmute_mod
         row.unmute_reason = reason
 
+    @staticmethod
+    def pending() -> List["Mute"]:
+        return db.query(Mute, active=True).filter(Mute.expires_at.isnot(None)).all()
+
 
 class Kick(db.Base):
     __tablename__ = "kick"
+    __table_args__ = (Index("ix_kick_member_timestamp", "member", "timestamp"),)
 
     id: Union[Column, int] = Column(Integer, primary_key=True, unique=True, autoincrement=True)
     member: Union[Column, int] = Column(BigInteger)
@@ -157,6 +209,10 @@ class Kick(db.Base):
 
 class Ban(db.Base):
     __tablename__ = "ban"
+    __table_args__ = (
+        Index("ix_ban_active_expires_at", "active", "expires_at"),
+        Index("ix_ban_member_active", "member", "active"),
+    )
 
     id: Union[Column, int] = Column(Integer, primary_key=True, unique=True, autoincrement=True)
     member: Union[Column, int] = Column(BigInteger)
@@ -169,20 +225,23 @@ class Ban(db.Base):
     deactivation_timestamp: Union[Column, Optional[datetime]] = Column(DateTime, nullable=True)
     unban_reason: Union[Column, Optional[str]] = Column(Text(collation="utf8mb4_bin"), nullable=True)
     unban_mod: Union[Column, Optional[int]] = Column(BigInteger, nullable=True)
+    expires_at: Union[Column, Optional[datetime]] = Column(DateTime, nullable=True)
 
     @staticmethod
     def create(member: int, member_name: str, mod: int, days: int, reason: str) -> "Ban":
+        timestamp = datetime.utcnow()
         row = Ban(
             member=member,
             member_name=member_name,
             mod=mod,
-            timestamp=datetime.utcnow(),
+            timestamp=timestamp,
             days=days,
             reason=reason,
             active=True,
             deactivation_timestamp=None,
             unban_reason=None,
             unban_mod=None,
+            expires_at=expiry_date(timestamp, days),
         )
         db.add(row)
         return row
@@ -194,3 +253,121 @@ class Ban(db.Base):
         row.deactivation_timestamp = datetime.utcnow()
         row.unban_mod = unban_mod
         row.unban_reason = unban_reason
+
+    @staticmethod
+    def pending() -> List["Ban"]:
+        return db.query(Ban, active=True).filter(Ban.expires_at.isnot(None)).all()
+
+
+def active_sanction(member: int) -> Optional["Sanction"]:
+    """
+    the active ban or, if there is none, the active mute of a member as (kind, days, expires_at)
+    """
+
+    sanctions = union_all(
+        *[
+            select([literal(kind).label("kind"), model.days, model.expires_at]).where(
+                (model.member == member) & model.active.is_(True)
+            )
+            for kind, model in [("ban", Ban), ("mute", Mute)]
+        ]
+    ).order_by("kind")
+    return db.session.execute(sanctions).first()
+
+
+Sanction = Tuple[str, int, Optional[datetime]]
+UserStats = Tuple[Dict[str, List[int]], Optional[Sanction]]
+
+
+def user_stats(member: int) -> UserStats:
+    """
+    active and passive count per sanction kind (from one grouped query) and the active sanction of a user
+    """
+
+    sources = [
+        ("report", Report, Report.reporter),
+        ("warn", Warn, Warn.mod),
+        ("mute", Mute, Mute.mod),
+        ("kick", Kick, Kick.mod),
+        ("ban", Ban, Ban.mod),
+    ]
+    sanctions = union_all(
+        *[
+            select([literal(kind).label("kind"), literal(passive).label("passive")]).where(column == member)
+            for kind, model, actor in sources
+            for passive, column in [(0, actor), (1, model.member)]
+        ]
+    ).alias("sanctions")
+    query = select([sanctions.c.kind, sanctions.c.passive, func.count()]).group_by(
+        sanctions.c.kind, sanctions.c.passive
+    )
+
+    counts: Dict[str, List[int]] = {kind: [0, 0] for kind, _, _ in sources}
+    for kind, passive, count in db.session.execute(query):
+        counts[kind][passive] = count
+    return counts, active_sanction(member)
+
+
+TimelineKey = Tuple[datetime, str, int]
+
+
+def timeline_query(member: int):
+    def entries(kind: str, model, timestamp, actor=None, text=None, new_text=None, number=None, condition=None):
+        columns = [
+            timestamp.label("timestamp"),
+            literal(kind).label("kind"),
+            model.id.label("id"),
+            (null() if actor is None else actor).label("actor"),
+            (null() if text is None else text).label("text"),
+            (null() if new_text is None else new_text).label("new_text"),
+            (null() if number is None else number).label("number"),
+        ]
+        where = model.member == member
+        return select(columns).where(where if condition is None else where & condition)
+
+    return union_all(
+        entries("join", Join, Join.timestamp),
+        entries("leave", Leave, Leave.timestamp),
+        entries(
+            "username_update",
+            UsernameUpdate,
+            UsernameUpdate.timestamp,
+            text=UsernameUpdate.member_name,
+            new_text=UsernameUpdate.new_name,
+            number=UsernameUpdate.nick,
+        ),
+        entries("report", Report, Report.timestamp, Report.reporter, Report.reason),
+        entries("warn", Warn, Warn.timestamp, Warn.mod, Warn.reason),
+        entries("mute", Mute, Mute.timestamp, Mute.mod, Mute.reason, number=Mute.days),
+        entries(
+            "unmute",
+            Mute,
+            Mute.deactivation_timestamp,
+            Mute.unmute_mod,
+            Mute.unmute_reason,
+            condition=Mute.active.is_(False),
+        ),
+        entries("kick", Kick, Kick.timestamp, Kick.mod, Kick.reason),
+        entries("ban", Ban, Ban.timestamp, Ban.mod, Ban.reason, number=Ban.days),
+        entries(
+            "unban",
+            Ban,
+            Ban.deactivation_timestamp,
+            Ban.unban_mod,
+            Ban.unban_reason,
+            condition=Ban.active.is_(False),
+        ),
+    ).alias("timeline")
+
+
+def user_timeline(member: int, after: Optional[TimelineKey], limit: int) -> list:
+    """
+    one page of all moderation log entries of a member, ordered by (timestamp, kind, id)
+    """
+
+    timeline = timeline_query(member)
+    order = [timeline.c.timestamp, timeline.c.kind, timeline.c.id]
+    query = select([timeline]).order_by(*order).limit(limit)
+    if after is not None:
+        query = query.where(tuple_(*order) > tuple_(*after))
+    return db.session.execute(query).fetchall()
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from functools import wraps
+from typing import Dict, Optional
+
+from discord.ext.commands import Bot
+
+from metrics import Histogram, register_gauge
+
+
+class Lane(IntEnum):
+    INTERACTIVE = 0
+    STARTUP = 1
+    BACKGROUND = 2
+
+
+current_lane = ContextVar("current_lane", default=Lane.INTERACTIVE)
+
+
+def in_lane(lane: Lane):
+    def decorator(func):
+        @wraps(func)
+        async def inner(*args, **kwargs):
+            token = current_lane.set(lane)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                current_lane.reset(token)
+
+        return inner
+
+    return decorator
+
+
+class OutboundScheduler:
+    def __init__(self, startup_slots: int = 4, background_slots: int = 2, max_wait: float = 5):
+        # interactive requests are never queued, the other lanes have their own budget
+        self.slots: Dict[Lane, Optional[int]] = {
+            Lane.INTERACTIVE: None,
+            Lane.STARTUP: startup_slots,
+            Lane.BACKGROUND: background_slots,
+        }
+        self.max_wait = max_wait
+        self.condition = asyncio.Condition()
+        self.waiting: Dict[Lane, int] = {lane: 0 for lane in Lane}
+        self.in_flight: Dict[Lane, int] = {lane: 0 for lane in Lane}
+        self.wait_time: Dict[Lane, Histogram] = {lane: Histogram() for lane in Lane}
+
+    def blocked(self, lane: Lane, waited: float) -> bool:
+        if (slots := self.slots[lane]) is not None and self.in_flight[lane] >= slots:
+            return True
+        if waited >= self.max_wait:
+            # aged requests only wait for their own lane, so lower lanes cannot starve
+            return False
+        if any(self.waiting[other] for other in Lane if other < lane):
+            return True
+        # while interactive requests are in flight, lower lanes keep a single request going
+        return self.in_flight[Lane.INTERACTIVE] > 0 and self.in_flight[lane] > 0
+
+    async def acquire(self, lane: Lane):
+        start = time.perf_counter()
+        if self.slots[lane] is not None:
+            self.waiting[lane] += 1
+            try:
+                async with self.condition:
+                    while self.blocked(lane, waited := time.perf_counter() - start):
+                        timeout = self.max_wait - waited if waited < self.max_wait else None
+                        try:
+                            await asyncio.wait_for(self.condition.wait(), timeout)
+                        except asyncio.TimeoutError:
+                            pass
+            finally:
+                self.waiting[lane] -= 1
+        self.in_flight[lane] += 1
+        self.wait_time[lane].observe(time.perf_counter() - start)
+
+    async def release(self, lane: Lane):
+        self.in_flight[lane] -= 1
+        async with self.condition:
+            self.condition.notify_all()
+
+
+scheduler = OutboundScheduler()
+
+
+def schedule_requests(bot: Bot):
+    request = bot.http.request
+
+    async def scheduled_request(*args, **kwargs):
+        lane = current_lane.get()
+        await scheduler.acquire(lane)
+        try:
+            return await request(*args, **kwargs)
+        finally:
+            await scheduler.release(lane)
+
+    bot.http.request = scheduled_request
+
+    for lane in Lane:
+        name = lane.name.lower()
+        register_gauge(f"outbound_{name}_queue_depth", lambda lane=lane: scheduler.waiting[lane])
+        register_gauge(f"outbound_{name}_in_flight", lambda lane=lane: scheduler.in_flight[lane])
+        register_gauge(f"outbound_{name}_requests_total", lambda lane=lane: scheduler.wait_time[lane].count)
+        register_gauge(f"outbound_{name}_wait_seconds_total", lambda lane=lane: scheduler.wait_time[lane].sum)
+        register_gauge(f"outbound_{name}_wait_seconds_p99", lambda lane=lane: scheduler.wait_time[lane].quantile(0.99))
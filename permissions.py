@@ -1,16 +1,37 @@
 from enum import auto
-from typing import Union
+from typing import Union, Dict, Tuple, FrozenSet, Optional
 
-from PyDrocsid.permission import BasePermission, BasePermissionLevel
-from PyDrocsid.settings import Settings
+from PyDrocsid.database import db, db_thread
+from PyDrocsid.permission import BasePermission, BasePermissionLevel, PermissionModel
 from PyDrocsid.translations import translations
 from discord import Member, User
 from discord.ext.commands import Converter, Context, BadArgument
 
+from settings import Settings
+
+
+permission_table: Dict[str, int] = {}
+
+
+async def load_permission_table():
+    def inner() -> Dict[str, int]:
+        table = {row.permission: row.level for row in db.query(PermissionModel)}
+        for permission in Permission:
+            if permission.name not in table:
+                table[permission.name] = PermissionModel.create(
+                    permission.name, permission.default_permission_level.value
+                ).level
+        return table
+
+    table = await db_thread(inner)
+    permission_table.clear()
+    permission_table.update(table)
+
 
 class Permission(BasePermission):
     change_prefix = auto()
     admininfo = auto()
+    view_metrics = auto()
     view_own_permissions = auto()
     view_all_permissions = auto()
 
@@ -48,6 +69,25 @@ class Permission(BasePermission):
     def default_permission_level(self) -> "BasePermissionLevel":
         return PermissionLevel.ADMINISTRATOR
 
+    async def resolve(self) -> "PermissionLevel":
+        if not permission_table:
+            await load_permission_table()
+        return PermissionLevel(permission_table[self.name])
+
+    async def set(self, level: "PermissionLevel"):
+        await super().set(level)
+        await load_permission_table()
+
+
+permission_level_cache: Dict[int, Tuple[FrozenSet[int], "PermissionLevel"]] = {}
+
+
+def invalidate_permission_levels(member_id: Optional[int] = None):
+    if member_id is None:
+        permission_level_cache.clear()
+    else:
+        permission_level_cache.pop(member_id, None)
+
 
 class PermissionLevel(BasePermissionLevel):
     PUBLIC, HEAD_ASSISTANT, HEAD, ADMINISTRATOR, OWNER = range(5)
@@ -60,12 +100,23 @@ class PermissionLevel(BasePermissionLevel):
         if not isinstance(member, Member):
             return PermissionLevel.PUBLIC
 
-        roles = {role.id for role in member.roles}
+        if member.guild_permissions.administrator:
+            return PermissionLevel.ADMINISTRATOR
+
+        roles = frozenset(role.id for role in member.roles)
+        if (cached := permission_level_cache.get(member.id)) is not None and cached[0] == roles:
+            return cached[1]
 
+        level = await cls.get_role_level(roles)
+        permission_level_cache[member.id] = roles, level
+        return level
+
+    @classmethod
+    async def get_role_level(cls, roles: FrozenSet[int]) -> "PermissionLevel":
         async def has_role(role_name):
             return await Settings.get(int, role_name + "_role") in roles
 
-        if member.guild_permissions.administrator or await has_role("admin"):
+        if await has_role("admin"):
             return PermissionLevel.ADMINISTRATOR
         if await has_role("head"):
             return PermissionLevel.HEAD
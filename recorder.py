@@ -0,0 +1,62 @@
+import gzip
+import json
+import time
+from typing import Optional, IO
+
+from PyDrocsid.events import listener
+from discord.ext.commands import Bot
+
+RECORDED_EVENTS = {
+    "READY",
+    "GUILD_CREATE",
+    "GUILD_MEMBER_ADD",
+    "GUILD_MEMBER_REMOVE",
+    "GUILD_MEMBER_UPDATE",
+    "MESSAGE_CREATE",
+    "MESSAGE_UPDATE",
+    "MESSAGE_DELETE",
+    "MESSAGE_DELETE_BULK",
+    "MESSAGE_REACTION_ADD",
+    "MESSAGE_REACTION_REMOVE",
+    "VOICE_STATE_UPDATE",
+}
+
+
+class EventRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        self.file: Optional[IO[str]] = None
+        self.start = 0.0
+        self.recorded = 0
+
+    def open(self):
+        self.file = gzip.open(self.path, "at", encoding="utf-8")
+        self.start = time.monotonic()
+
+    async def on_socket_response(self, msg: dict):
+        if self.file is None or msg.get("op") != 0 or msg.get("t") not in RECORDED_EVENTS:
+            return
+
+        offset = round(time.monotonic() - self.start, 4)
+        self.file.write(json.dumps([offset, msg["t"], msg["d"]], separators=(",", ":")) + "\n")
+        self.recorded += 1
+
+    async def on_shutdown(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_events(path: str):
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def start_recording(bot: Bot, path: str) -> EventRecorder:
+    recorder = EventRecorder(path)
+    recorder.open()
+    bot.add_listener(recorder.on_socket_response)
+    listener(recorder.on_shutdown)
+    return recorder
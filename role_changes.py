@@ -0,0 +1,126 @@
+import asyncio
+import time
+import traceback
+from collections import OrderedDict
+from typing import Dict, Optional, Iterable, Set, Tuple
+
+from PyDrocsid.events import listener
+from discord import Member, Role, NotFound, HTTPException
+
+from metrics import register_gauge
+
+
+class PendingRoleChange:
+    def __init__(self, member: Member):
+        self.member = member
+        self.roles: Dict[Role, bool] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+
+
+class RoleChanges:
+    def __init__(self, delay: float = 0.25, confirm_timeout: float = 10):
+        self.delay = delay
+        self.confirm_timeout = confirm_timeout
+        self.pending: Dict[int, PendingRoleChange] = {}
+        # changes which have been sent but might not have reached the member cache yet
+        self.unconfirmed: "OrderedDict[int, Tuple[float, Dict[Role, bool]]]" = OrderedDict()
+        self.requested = 0
+        self.edits = 0
+
+    def queue(self, member: Member, roles: Iterable[Role], add: bool):
+        if (change := self.pending.get(member.id)) is None:
+            change = self.pending[member.id] = PendingRoleChange(member)
+            change.flush_task = asyncio.create_task(self.delayed_flush(member.id))
+
+        for role in roles:
+            change.roles[role] = add
+            self.requested += 1
+
+    async def add_roles(self, member: Member, *roles: Role, immediate: bool = False):
+        self.queue(member, roles, True)
+        if immediate:
+            await self.flush(member.id)
+
+    async def remove_roles(self, member: Member, *roles: Role, immediate: bool = False):
+        self.queue(member, roles, False)
+        if immediate:
+            await self.flush(member.id)
+
+    def expected_roles(self, member: Member) -> Set[Role]:
+        """
+        the roles of a member as of the last edit sent, even if the gateway has not confirmed it yet
+        """
+
+        now = time.monotonic()
+        while self.unconfirmed and now - next(iter(self.unconfirmed.values()))[0] > self.confirm_timeout:
+            self.unconfirmed.popitem(last=False)
+
+        roles = {role for role in member.roles if not role.is_default()}
+        if (entry := self.unconfirmed.get(member.id)) is None:
+            return roles
+
+        _, changes = entry
+        for role, add in [*changes.items()]:
+            if (role in roles) == add:
+                del changes[role]
+            elif add:
+                roles.add(role)
+            else:
+                roles.discard(role)
+        return roles
+
+    async def flush(self, member_id: int):
+        if (change := self.pending.pop(member_id, None)) is None:
+            return
+        if change.flush_task is not asyncio.current_task():
+            change.flush_task.cancel()
+
+        member: Member = change.member.guild.get_member(member_id) or change.member
+        roles = self.expected_roles(member)
+        for role, add in change.roles.items():
+            if add:
+                roles.add(role)
+            else:
+                roles.discard(role)
+
+        _, changes = self.unconfirmed.pop(member_id, (None, {}))
+        changes.update(change.roles)
+        self.unconfirmed[member_id] = time.monotonic(), changes
+
+        self.edits += 1
+        try:
+            await member.edit(roles=list(roles))
+        except HTTPException:
+            for role, add in change.roles.items():
+                if changes.get(role) is add:
+                    del changes[role]
+            raise
+
+    async def delayed_flush(self, member_id: int):
+        await asyncio.sleep(self.delay)
+        await self.try_flush(member_id)
+
+    async def try_flush(self, member_id: int):
+        try:
+            await self.flush(member_id)
+        except NotFound:  # member left the server
+            pass
+        except HTTPException:
+            traceback.print_exc()
+
+    async def close(self):
+        for member_id in [*self.pending]:
+            await self.try_flush(member_id)
+
+
+role_changes = RoleChanges()
+
+register_gauge("role_changes_requested", lambda: role_changes.requested)
+register_gauge("role_changes_edits", lambda: role_changes.edits)
+register_gauge("role_changes_pending", lambda: len(role_changes.pending))
+register_gauge("role_changes_unconfirmed", lambda: len(role_changes.unconfirmed))
+
+
+@listener
+async def on_shutdown():
+    await role_changes.close()
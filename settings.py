@@ -0,0 +1,55 @@
+from typing import Dict, Optional, Type, TypeVar, Union
+
+from PyDrocsid.database import db, db_thread
+from PyDrocsid.settings import Settings as SettingsModel
+
+T = TypeVar("T")
+
+
+def serialize(value: Union[str, int, float, bool]) -> str:
+    if isinstance(value, bool):
+        value = int(value)
+    return str(value)
+
+
+def deserialize(dtype: Type[T], value: str) -> T:
+    if dtype == bool:
+        return dtype(int(value))
+    return dtype(value)
+
+
+class Settings:
+    cache: Dict[str, str] = {}
+    loaded: bool = False
+    hits: int = 0
+    misses: int = 0
+
+    @staticmethod
+    async def load():
+        def inner() -> Dict[str, str]:
+            return {row.key: row.value for row in db.query(SettingsModel)}
+
+        Settings.cache = await db_thread(inner)
+        Settings.loaded = True
+
+    @staticmethod
+    async def get(dtype: Type[T], key: str, default: Optional[T] = None) -> Optional[T]:
+        if not Settings.loaded:
+            await Settings.load()
+
+        if key in Settings.cache:
+            Settings.hits += 1
+            return deserialize(dtype, Settings.cache[key])
+        if default is None:
+            Settings.hits += 1
+            return None
+
+        Settings.misses += 1
+        value: T = await db_thread(SettingsModel._get, dtype, key, default)
+        Settings.cache[key] = serialize(value)
+        return value
+
+    @staticmethod
+    async def set(dtype: Type[T], key: str, value: T):
+        await db_thread(SettingsModel._set, dtype, key, value)
+        Settings.cache[key] = serialize(value)
@@ -0,0 +1,59 @@
+import asyncio
+import time
+import traceback
+from collections import Counter
+from typing import Dict, List, Callable, Awaitable, Optional
+
+from PyDrocsid.translations import translations
+
+Action = Callable[[], Awaitable[None]]
+
+
+class StartupPlan:
+    def __init__(self):
+        self.phases: Dict[str, List[Action]] = {}
+        self.done: Counter = Counter()
+        self.failed: Counter = Counter()
+        self.durations: Dict[str, float] = {}
+
+    def add(self, phase: str, action: Action):
+        self.phases.setdefault(phase, []).append(action)
+
+    @property
+    def total(self) -> int:
+        return sum(map(len, self.phases.values()))
+
+    @property
+    def completed(self) -> int:
+        return sum(self.done.values()) + sum(self.failed.values())
+
+    async def run_phase(self, phase: str, actions: List[Action], semaphore: asyncio.Semaphore):
+        async def run(action: Action):
+            async with semaphore:
+                try:
+                    await action()
+                except Exception:  # skipcq: PYL-W0703
+                    self.failed[phase] += 1
+                    traceback.print_exc()
+                else:
+                    self.done[phase] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*map(run, actions))
+        self.durations[phase] = time.perf_counter() - start
+        print(translations.f_startup_phase_done(phase, len(actions), self.failed[phase], self.durations[phase]))
+
+    async def execute(
+        self,
+        concurrency: int,
+        progress: Optional[Callable[["StartupPlan"], Awaitable[None]]] = None,
+        interval: float = 10,
+    ):
+        semaphore = asyncio.Semaphore(concurrency)
+        task = asyncio.gather(*[self.run_phase(phase, actions, semaphore) for phase, actions in self.phases.items()])
+        while True:
+            done, _ = await asyncio.wait([task], timeout=interval)
+            if progress is not None:
+                await progress(self)
+            if done:
+                break
@@ -1,12 +1,15 @@
 import io
-from typing import Tuple, List, Optional
+import time
+from collections import OrderedDict
+from os.path import commonprefix
+from typing import Tuple, List, Optional, Hashable
 
-from PyDrocsid.settings import Settings
 from PyDrocsid.translations import translations
 from discord import Attachment, File, TextChannel, Member, Message, Embed, Guild
 from discord.ext.commands import Bot, CommandError
 
 from permissions import PermissionLevel
+from settings import Settings
 
 ACTIVE_ROLES = {
     "admin",
@@ -27,6 +30,87 @@ ACTIVE_ROLES = {
 }
 
 
+def bounded_edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    levenshtein distance between a and b, capped at limit
+    """
+
+    if limit <= 0:
+        return limit
+
+    prefix = len(commonprefix([a, b]))
+    a, b = a[prefix:], b[prefix:]
+    suffix = len(commonprefix([a[::-1], b[::-1]]))
+    a, b = a[: len(a) - suffix], b[: len(b) - suffix]
+    if len(a) > len(b):
+        a, b = b, a
+
+    n, m = len(a), len(b)
+    if m - n >= limit:
+        return limit
+    if not n:
+        return m
+
+    # only cells within k of the diagonal can hold a distance below limit
+    k = limit - 1
+    prev = [min(j, limit) for j in range(m + 1)]
+    cur = [limit] * (m + 1)
+    for i in range(1, n + 1):
+        lo, hi = max(1, i - k), min(m, i + k)
+        cur[lo - 1] = min(i, limit) if lo == 1 else limit
+        row_min = cur[lo - 1]
+        char = a[i - 1]
+        for j in range(lo, hi + 1):
+            value = prev[j - 1] + (char != b[j - 1])
+            if prev[j] < value:
+                value = prev[j] + 1
+            if cur[j - 1] < value:
+                value = cur[j - 1] + 1
+            cur[j] = value = min(value, limit)
+            row_min = min(row_min, value)
+        if row_min >= limit:
+            return limit
+        prev, cur = cur, prev
+    return prev[m]
+
+
+class ExpiringSet:
+    """
+    set whose items are dropped after ttl seconds or when more than max_size items are stored
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.items: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def sweep(self):
+        now = time.monotonic()
+        # all items share the same ttl, so the oldest insertions expire first
+        while self.items and next(iter(self.items.values())) <= now:
+            self.items.popitem(last=False)
+
+    def add(self, item: Hashable):
+        self.items.pop(item, None)
+        self.items[item] = time.monotonic() + self.ttl
+        self.sweep()
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def discard(self, item: Hashable):
+        self.items.pop(item, None)
+
+    def remove(self, item: Hashable):
+        del self.items[item]
+
+    def __contains__(self, item: Hashable) -> bool:
+        return (expiry := self.items.get(item)) is not None and expiry > time.monotonic()
+
+    def __len__(self) -> int:
+        self.sweep()
+        return len(self.items)
+
+
 def make_error(message) -> str:
     return f":x: Error: {message}"
 